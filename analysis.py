@@ -4,42 +4,87 @@ analysis.py — Final analysis for NYC Taxi CO₂ (2015–2024)
 
 - Uses ENRICHED fact table (default: fct_trips_enriched)
 - No materialized TEMP table (avoids massive spill files)
-- "Largest trip" computed per taxi_type via streaming Top-1 (no huge sort)
+- Largest TOP_K trips per taxi_type via streaming arg_max (no huge sort)
+- Largest trips, hour/day/week/month stats and monthly totals from one GROUPING SETS scan
+  (ANALYSIS_ENGINE=per_query runs the original one-query-per-statistic version,
+  ANALYSIS_ENGINE=rollup answers from the dbt fct_co2_rollup mart)
+- Results are fetched as Arrow tables; the plot series are NumPy views of the Arrow
+  buffers (no pandas conversion, to_datetime or pivot)
 - Clear logging + timings, plot saved to plots/monthly_co2_by_type.png
+- Results are cached on disk (analysis_cache/) per query and data fingerprint, so a
+  rerun on unchanged data only reads them back
+- Independent queries (the per_query engine's scans, the rollup engine's trip-level
+  fallback) run concurrently on cursors of the one connection, ANALYSIS_PARALLEL at a time
+- ANALYSIS_PROFILE=1 saves DuckDB's JSON profile of every query to profiles/<label>.json
+  and ends the run with a table of latency, rows scanned, peak memory and spill per query
+  (also written to profiles/summary.json)
+- One question at a time: python analysis.py {largest,hour,dow,woy,moy,plot,all}
+  (default all). Importing the module has no side effects; matplotlib is only
+  loaded for the plot.
 """
 
+import argparse
+import json
 import os
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import duckdb
-import pandas as pd
-import matplotlib.pyplot as plt
+import pyarrow as pa
+
+import planner
+import profiling
+import result_cache
 
 # -----------------------------
 # Config
 # -----------------------------
-DB_PATH = "emissions.duckdb"
-if not os.path.exists(DB_PATH):
-    raise FileNotFoundError(f"Expected DuckDB at {DB_PATH}")
+DB_PATH = os.getenv("DB_PATH", "emissions.duckdb")
 
 FACT_TABLE = os.getenv("FACT_TABLE", "fct_trips_enriched")
 
-PLOT_DIR = Path("plots"); PLOT_DIR.mkdir(parents=True, exist_ok=True)
+TAXI_TYPES = ("YELLOW", "GREEN")
+
+# Number of largest carbon-producing trips reported per taxi type
+TOP_K = int(os.getenv("TOP_K", "1"))
+
+# "grouping_sets" (one scan for all grouped stats), "per_query" (one scan per statistic)
+# or "rollup" (read the dbt fct_co2_rollup mart; no trip-level scan unless TOP_K > 1)
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "grouping_sets")
+ROLLUP_TABLE = os.getenv("ROLLUP_TABLE", "fct_co2_rollup")
+
+PLOT_DIR = Path("plots")
 PLOT_FILE = PLOT_DIR / "monthly_co2_by_type.png"
 
+# Subcommands, in report order; "all" runs every one of them
+SECTIONS = ("largest", "hour", "dow", "woy", "moy", "plot")
+
+# Query result cache (result_cache.py); ANALYSIS_CACHE_DIR="" turns it off
+ANALYSIS_CACHE_DIR       = os.getenv("ANALYSIS_CACHE_DIR", "analysis_cache")
+ANALYSIS_CACHE_MAX_BYTES = planner.parse_bytes(os.getenv("ANALYSIS_CACHE_MAX_BYTES", "256MiB"))
+
+# Queries run at the same time by _run_concurrent, each on its own cursor
+ANALYSIS_PARALLEL = max(1, int(os.getenv("ANALYSIS_PARALLEL", "4")))
+
+# Opt-in DuckDB JSON profiling of each executed query (profiling.py)
+ANALYSIS_PROFILE = os.getenv("ANALYSIS_PROFILE", "0") == "1"
+PROFILE_DIR = Path("profiles")
+
+# Summaries of this run's profiles, in completion order
+_profiles = []
+
+# The run's ResultCache, opened by main() once the data fingerprint is known
+_cache = None
+
 START_TS = "2015-01-01"
 END_TS   = "2025-01-01"
 
 # -----------------------------
-# Logging
+# Logging (configured when run as a script)
 # -----------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    filename="analysis.log"
-)
 logger = logging.getLogger(__name__)
 
 def sizeof_fmt(num: int, suffix="B") -> str:
@@ -50,16 +95,19 @@ def sizeof_fmt(num: int, suffix="B") -> str:
     return f"{num:.1f} Y{suffix}"
 
 def _qualify_table(con, table_name: str) -> str:
-    q = con.execute("""
+    # Inlined literal: binding a parameter makes duckdb import pandas, which a text-only run
+    # otherwise never needs
+    literal = "'" + table_name.replace("'", "''") + "'"
+    q = con.execute(f"""
         SELECT table_schema, table_name
         FROM information_schema.tables
-        WHERE lower(table_name) = lower(?)
+        WHERE lower(table_name) = lower({literal})
         ORDER BY (table_schema = 'main') DESC
         LIMIT 1
-    """, [table_name]).df()
-    if q.empty:
+    """).fetchone()
+    if q is None:
         raise RuntimeError(f"Could not find table named '{table_name}' in DuckDB.")
-    return f"{q.loc[0,'table_schema']}.\"{q.loc[0,'table_name']}\""
+    return f"{q[0]}.\"{q[1]}\""
 
 def _dow_label(x):
     labels = ["Sun","Mon","Tue","Wed","Thu","Fri","Sat"]
@@ -74,40 +122,346 @@ def _dow_label(x):
     return str(x)
 
 def _fmt_int(x):
-    return "NA" if pd.isna(x) else str(int(x))
+    return "NA" if x is None else str(int(x))
+
+# Concurrent queries print their START/END lines from worker threads
+_print_lock = threading.Lock()
 
 def print_and_log(msg: str):
-    print(msg); logger.info(msg)
+    with _print_lock:
+        print(msg)
+    logger.info(msg)
 
-def run_query(con, label: str, sql: str, params=None) -> pd.DataFrame:
-    print_and_log(f"START: {label}")
+def run_query(con, label: str, sql: str, params=None, queued_at=None) -> pa.Table:
+    """
+    One query's result, from the cache when possible. queued_at (perf_counter) is when the
+    query was submitted; the END line reports the wait for a free slot separately from the
+    execution time.
+    """
     t0 = time.perf_counter()
-    df = con.execute(sql, params or []).df()
+    queued = t0 - queued_at if queued_at is not None else 0.0
+    print_and_log(f"START: {label}")
+    key = _cache.key(sql, params) if _cache is not None else None
+    tbl = _cache.get(key) if key else None
+    cached = tbl is not None
+    if not cached:
+        profile = profiling.profile_path(PROFILE_DIR, label) if ANALYSIS_PROFILE else None
+        if profile:
+            profiling.enable(con, profile)
+        try:
+            tbl = con.execute(sql, params or []).to_arrow_table()
+        finally:
+            if profile:
+                profiling.disable(con)
+        if profile:
+            _profiles.append(profiling.summarize(label, profile))
+        if key:
+            _cache.put(key, label, tbl)
     dt = time.perf_counter() - t0
-    print_and_log(f"END:   {label} | {dt:0.2f}s | rows={len(df)}")
-    return df
+    print_and_log(
+        f"END:   {label} | {dt:0.2f}s | queued {queued:0.2f}s | rows={tbl.num_rows}{' | cached' if cached else ''}"
+    )
+    return tbl
+
+def _run_on_cursor(con, label: str, sql: str, queued_at: float) -> pa.Table:
+    cur = con.cursor()
+    try:
+        return run_query(cur, label, sql, queued_at=queued_at)
+    finally:
+        cur.close()
+
+def _run_concurrent(con, jobs: dict) -> dict:
+    """
+    {name: (label, sql)} -> {name: Arrow table}. The queries are independent, so they run
+    ANALYSIS_PARALLEL at a time, each on its own cursor of con. threads and memory_limit are
+    database-wide (they cannot be set per cursor), so every running query draws on the shared
+    pool; the logged per-query share is the planned total split over the slots.
+    """
+    if len(jobs) <= 1 or ANALYSIS_PARALLEL == 1:
+        return {name: run_query(con, label, sql) for name, (label, sql) in jobs.items()}
+
+    slots = min(ANALYSIS_PARALLEL, len(jobs))
+    threads = con.execute("SELECT current_setting('threads')").fetchone()[0]
+    memory = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+    print_and_log(
+        f"Running {len(jobs)} queries, {slots} at a time "
+        f"(each ~{max(1, threads // slots)} of {threads} threads, ~1/{slots} of memory_limit {memory})"
+    )
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=slots, thread_name_prefix="analysis") as pool:
+        futures = {
+            name: pool.submit(_run_on_cursor, con, label, sql, time.perf_counter())
+            for name, (label, sql) in jobs.items()
+        }
+        results = {name: fut.result() for name, fut in futures.items()}
+    print_and_log(f"{len(jobs)} queries done in {time.perf_counter() - t0:0.2f}s")
+    return results
+
+def _grouped_per_query(con, core_cte: str, sections):
+    """Legacy engine: one scan per taxi type for the largest trips, per dimension and for the monthly totals."""
+    jobs = {}
+
+    # 1) Largest carbon-producing trips (per taxi_type) — per-type Top-K
+    if "largest" in sections:
+        for ttype in TAXI_TYPES:
+            # Constants inlined rather than bound: binding makes duckdb import pandas
+            largest_one_sql = core_cte + f"""
+                SELECT
+                    taxi_type,
+                    pickup_ts,
+                    trip_distance,
+                    avg_mph,
+                    trip_co2_kgs
+                FROM core
+                WHERE taxi_type = '{ttype}'
+                ORDER BY trip_co2_kgs DESC, pickup_ts ASC
+                LIMIT {TOP_K};
+            """
+            jobs[("largest", ttype)] = (f"Largest carbon-producing trip — {ttype}", largest_one_sql)
+
+    # 2-5) Hour-of-day, day-of-week, week-of-year, month-of-year heavy/light (avg CO2 per trip)
+    for col, (prefix, key) in _DIMENSIONS.items():
+        if prefix not in sections:
+            continue
+        stats_sql = core_cte + f"""
+            , stats AS (
+                SELECT taxi_type, {col} AS {key}, AVG(trip_co2_kgs) AS avg_co2
+                FROM core
+                GROUP BY 1,2
+            ),
+            ranked AS (
+                SELECT *,
+                       RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 DESC) AS r_desc,
+                       RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 ASC)  AS r_asc
+                FROM stats
+            )
+            SELECT taxi_type,
+                   MAX(CASE WHEN r_desc=1 THEN {key} END)    AS heavy_{prefix},
+                   MAX(CASE WHEN r_desc=1 THEN avg_co2 END)  AS heavy_{prefix}_avg_co2,
+                   MAX(CASE WHEN r_asc =1 THEN {key} END)    AS light_{prefix},
+                   MAX(CASE WHEN r_asc =1 THEN avg_co2 END)  AS light_{prefix}_avg_co2
+            FROM ranked
+            GROUP BY taxi_type
+            ORDER BY taxi_type;
+        """
+        jobs[prefix] = (f"{_DIMENSION_LABELS[prefix]} heavy/light (avg CO2 per trip)", stats_sql)
+
+    # Monthly CO2 totals (for plot)
+    if "plot" in sections:
+        monthly_totals_sql = core_cte + """
+            SELECT
+                taxi_type,
+                DATE_TRUNC('month', pickup_ts) AS month,
+                SUM(trip_co2_kgs) AS total_co2_kg
+            FROM core
+            GROUP BY 1,2
+            ORDER BY month, taxi_type;
+        """
+        jobs["plot"] = ("Monthly CO2 totals by taxi type (for plotting)", monthly_totals_sql)
+
+    tables = _run_concurrent(con, jobs)
+    results = {}
+    if "largest" in sections:
+        results["largest"] = [r for ttype in TAXI_TYPES for r in tables[("largest", ttype)].to_pylist()]
+    for prefix in _DIMENSION_LABELS:
+        if prefix in tables:
+            results[prefix] = tables[prefix].to_pylist()
+    if "plot" in tables:
+        results["plot"] = tables["plot"]
+    return results
+
+# Grouping keys answered by the single GROUPING SETS scan: key column -> (prefix, output key name)
+_DIMENSIONS = {
+    "hour_of_day":   ("hour", "hour"),
+    "day_of_week":   ("dow",  "dow"),
+    "week_of_year":  ("woy",  "woy"),
+    "month_of_year": ("moy",  "moy"),
+}
+_DIMENSION_LABELS = {"hour": "Hour-of-day", "dow": "Day-of-week", "woy": "Week-of-year", "moy": "Month-of-year"}
+
+def _grouping(sections):
+    """
+    (select columns, grouping sets) for the requested sections only: one (taxi_type, key) set
+    per dimension asked for, (taxi_type, month) for the plot and (taxi_type) for the top trips.
+    Every row is flagged by_<key> / by_type with the set it belongs to.
+    """
+    keys = [col for col, (prefix, _) in _DIMENSIONS.items() if prefix in sections]
+    keys += ["month"] if "plot" in sections else []
+    sets = [f"(taxi_type, {k})" for k in keys] + (["(taxi_type)"] if "largest" in sections or not keys else [])
+    cols = keys + [f"GROUPING({k}) = 0 AS by_{k}" for k in keys]
+    if "month" not in keys:
+        cols.append("FALSE AS by_month")
+    # all keys rolled up
+    cols.append(f"GROUPING({', '.join(keys)}) = {2 ** len(keys) - 1} AS by_type" if keys else "TRUE AS by_type")
+    return ",\n               ".join(cols), ", ".join(sets)
+
+def _heavy_light(stats, key: str, prefix: str) -> list:
+    """
+    Same result as RANK() over avg_co2 + MAX(CASE WHEN rank=1 ...) in the per-query engine:
+    on ties the largest key wins, and NULL averages never rank first.
+    stats: rows (dicts) with taxi_type, key and avg_co2.
+    """
+    rows = []
+    for ttype in sorted({r["taxi_type"] for r in stats if r["taxi_type"] is not None}):
+        g = [r for r in stats if r["taxi_type"] == ttype and r["avg_co2"] is not None]
+        row = {"taxi_type": ttype}
+        for side, best in (("heavy", max), ("light", min)):
+            avg = best(r["avg_co2"] for r in g) if g else None
+            row[f"{side}_{prefix}"] = max(r[key] for r in g if r["avg_co2"] == avg) if g else None
+            row[f"{side}_{prefix}_avg_co2"] = avg
+        rows.append(row)
+    return rows
+
+# Top-K by CO2, earliest pickup first on ties (same order as ORDER BY ... LIMIT K)
+_TOP_TRIPS_AGG = f"""arg_max(
+                   {{'pickup_ts': pickup_ts, 'trip_distance': trip_distance,
+                     'avg_mph': avg_mph, 'trip_co2_kgs': trip_co2_kgs}},
+                   (trip_co2_kgs, -epoch_us(pickup_ts)),
+                   {TOP_K}
+               ) FILTER (WHERE trip_co2_kgs IS NOT NULL)"""
+
+def _derive_results(grouped: pa.Table, sections, top_trips=None) -> dict:
+    """
+    {section: result} from the by_* flagged GROUPING SETS result: rows (dicts) for the text
+    sections, an Arrow table for the plot. top_trips ({taxi_type: trips}) replaces the
+    top_trips column when given.
+    """
+    # A few hundred rows: plain Python is enough for the ranks (building Arrow tables here
+    # would make pyarrow import pandas)
+    rows = [r for r in grouped.to_pylist() if not r["by_month"]]
+    results = {}
+    if "largest" in sections:
+        top = top_trips or {r["taxi_type"]: r["top_trips"] for r in rows if r["by_type"]}
+        results["largest"] = [
+            {"taxi_type": ttype, **trip} for ttype in TAXI_TYPES for trip in top.get(ttype) or []
+        ]
+
+    # AVG = SUM / COUNT of non-NULL values (NULL when a group has none, as AVG would return)
+    for r in rows:
+        r["avg_co2"] = r["sum_co2"] / int(r["n_co2"]) if r["n_co2"] else None
+
+    for col, (prefix, key) in _DIMENSIONS.items():
+        if prefix in sections:
+            part = [{**r, key: r[col]} for r in rows if r[f"by_{col}"]]
+            results[prefix] = _heavy_light(part, key, prefix)
+
+    if "plot" in sections:
+        # The plot series stays in Arrow
+        import pyarrow.compute as pc
+        results["plot"] = (
+            grouped.filter(pc.field("by_month"))
+            .select(["taxi_type", "month", "sum_co2"])
+            .rename_columns(["taxi_type", "month", "total_co2_kg"])
+            .sort_by([("month", "ascending"), ("taxi_type", "ascending")])
+        )
+    return results
+
+def _grouped_single_scan(con, core_cte: str, sections):
+    """
+    One GROUPING SETS scan returns SUM/COUNT of trip_co2_kgs per (taxi_type, key) for every
+    requested dimension plus the monthly totals, and the top-K trips per taxi_type (arg_max
+    keeps a bounded heap per group, so no sort); heavy/light ranks and the plot series are
+    derived from that small result in memory.
+    """
+    cols, sets = _grouping(sections)
+    top_trips = _TOP_TRIPS_AGG if "largest" in sections else "NULL"
+    grouped_sql = core_cte + f"""
+        SELECT taxi_type,
+               {cols},
+               SUM(trip_co2_kgs)   AS sum_co2,
+               COUNT(trip_co2_kgs) AS n_co2,
+               {top_trips} AS top_trips
+        FROM (SELECT *, DATE_TRUNC('month', pickup_ts) AS month FROM core)
+        GROUP BY GROUPING SETS ({sets});
+    """
+    label = "Largest trips + per-dimension" if "largest" in sections else "Per-dimension"
+    grouped = run_query(con, f"{label} CO2 sums/counts (GROUPING SETS, single scan)", grouped_sql)
+    return _derive_results(grouped, sections)
+
+def _grouped_from_rollup(con, core_cte: str, rollup: str, sections):
+    """
+    Same results from the dbt rollup mart (one row per taxi_type, month, hour, day of week,
+    week of year): sums and counts are re-aggregated per dimension, and the largest trip per
+    type is the largest of the per-cell maxima. Only the top-K trips for K > 1 are not in
+    the rollup, so they alone fall back to the trip-level view.
+    """
+    cols, sets = _grouping(sections)
+    top_trips = "NULL" if TOP_K > 1 or "largest" not in sections else """arg_max(
+                   {'pickup_ts': max_co2_pickup_ts, 'trip_distance': max_co2_trip_distance,
+                     'avg_mph': max_co2_avg_mph, 'trip_co2_kgs': max_trip_co2_kgs},
+                   (max_trip_co2_kgs, -epoch_us(max_co2_pickup_ts)),
+                   1
+               ) FILTER (WHERE max_trip_co2_kgs IS NOT NULL)"""
+    grouped_sql = f"""
+        SELECT taxi_type,
+               {cols},
+               SUM(co2_kgs_sum)    AS sum_co2,
+               SUM(co2_trip_count) AS n_co2,
+               {top_trips} AS top_trips
+        FROM (
+            SELECT * REPLACE (taxi_type::VARCHAR AS taxi_type), extract('month' FROM month) AS month_of_year
+            FROM {rollup}
+        )
+        WHERE month >= TIMESTAMP '{START_TS}'
+          AND month <  TIMESTAMP '{END_TS}'
+        GROUP BY GROUPING SETS ({sets});
+    """
+    jobs = {"grouped": (f"Per-dimension CO2 sums/counts from rollup {rollup}", grouped_sql)}
+
+    if TOP_K > 1 and "largest" in sections:
+        top_sql = core_cte + f"""
+            SELECT taxi_type, {_TOP_TRIPS_AGG} AS top_trips
+            FROM core
+            GROUP BY taxi_type;
+        """
+        jobs["top"] = (f"Top {TOP_K} carbon-producing trips (trip-level fallback)", top_sql)
+    tables = _run_concurrent(con, jobs)
+    if "top" in tables:
+        top = {r["taxi_type"]: r["top_trips"] for r in tables["top"].to_pylist()}
+        return _derive_results(tables["grouped"], sections, top)
+    return _derive_results(tables["grouped"], sections)
+
+def _plot_monthly(monthly: pa.Table):
+    # Only the plot needs matplotlib and pyarrow.compute
+    import matplotlib.pyplot as plt
+    import pyarrow.compute as pc
+
+    print_and_log("Preparing monthly totals for plotting...")
+    # One (datetime64, float64) pair per taxi type, read straight from the Arrow buffers
+    # (copied only where a NULL total has to become NaN)
+    series = {}
+    for ttype in TAXI_TYPES:
+        part = monthly.filter(pc.equal(monthly["taxi_type"], ttype))
+        series[ttype] = (part["month"].to_numpy(), part["total_co2_kg"].to_numpy())
+    print_and_log("Monthly series for plot: " + ", ".join(f"{t}={len(x)} months" for t, (x, _) in series.items()))
+
+    PLOT_DIR.mkdir(parents=True, exist_ok=True)
+    print_and_log(f"Creating plot: {PLOT_FILE}")
+    plt.figure(figsize=(12, 5))
+    for ttype, (x, y) in series.items():
+        plt.plot(x, y, label=ttype)
+    plt.title("Monthly CO2 Totals by Taxi Type (2015–2024)")
+    plt.xlabel("Month")
+    plt.ylabel("Total CO2 (kg)")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(PLOT_FILE, dpi=150)
+    plt.close()
+    print_and_log(f"Saved plot to: {PLOT_FILE}")
+
+def main(sections=SECTIONS):
+    global _cache
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError(f"Expected DuckDB at {DB_PATH}")
 
-def main():
     # Connect
     db_size = sizeof_fmt(os.path.getsize(DB_PATH))
     print_and_log(f"Connecting to DuckDB at: {DB_PATH} (size: {db_size})")
     con = duckdb.connect(DB_PATH, read_only=True)
 
-    # Performance PRAGMAs
-    try:
-        con.execute(f"PRAGMA threads={os.cpu_count()}"); print_and_log(f"PRAGMA threads set to {os.cpu_count()}")
-    except Exception as e:
-        print_and_log(f"PRAGMA threads not set: {e}")
-    try:
-        con.execute("PRAGMA memory_limit='6GB'"); print_and_log("PRAGMA memory_limit set to 6GB")
-    except Exception as e:
-        print_and_log(f"PRAGMA memory_limit not set: {e}")
-    try:
-        os.makedirs("/tmp/duckdb_tmp", exist_ok=True)
-        con.execute("PRAGMA temp_directory='/tmp/duckdb_tmp'")
-        print_and_log("PRAGMA temp_directory set to /tmp/duckdb_tmp")
-    except Exception as e:
-        print_and_log(f"PRAGMA temp_directory not set: {e}")
+    # Performance PRAGMAs from the preflight planner; every engine aggregates into a few
+    # hundred groups (and top-K keeps K rows), so the scans stream and the working set is small
+    planner.apply(con, planner.plan("analysis", [(ANALYSIS_ENGINE, 0)], db_path=DB_PATH))
 
     # Fact table
     table = _qualify_table(con, FACT_TABLE)
@@ -117,7 +471,7 @@ def main():
     core_cte = f"""
         WITH core AS (
           SELECT
-            taxi_type,
+            taxi_type::VARCHAR AS taxi_type,  -- ENUM in the mart; report and sort as text
             pickup_ts,
             trip_distance,
             avg_mph,
@@ -132,209 +486,131 @@ def main():
         )
     """
 
-    # 1) Largest carbon-producing trip (per taxi_type) — per-type Top-1
-    largest_rows = []
-    for ttype in ("YELLOW", "GREEN"):
-        largest_one_sql = core_cte + """
-            SELECT
-                taxi_type,
-                pickup_ts,
-                trip_distance,
-                avg_mph,
-                trip_co2_kgs
-            FROM core
-            WHERE taxi_type = ?
-            ORDER BY trip_co2_kgs DESC, pickup_ts ASC
-            LIMIT 1;
-        """
-        df_one = run_query(con, f"Largest carbon-producing trip — {ttype}", largest_one_sql, [ttype])
-        largest_rows.append(df_one)
-    largest = pd.concat(largest_rows, ignore_index=True)
-
-    # 2) Hour-of-day heavy/light (avg CO2 per trip)
-    hour_sql = core_cte + """
-        , stats AS (
-            SELECT taxi_type, hour_of_day AS hour, AVG(trip_co2_kgs) AS avg_co2
-            FROM core
-            GROUP BY 1,2
-        ),
-        ranked AS (
-            SELECT *,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 DESC) AS r_desc,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 ASC)  AS r_asc
-            FROM stats
-        )
-        SELECT taxi_type,
-               MAX(CASE WHEN r_desc=1 THEN hour END)     AS heavy_hour,
-               MAX(CASE WHEN r_desc=1 THEN avg_co2 END)  AS heavy_hour_avg_co2,
-               MAX(CASE WHEN r_asc =1 THEN hour END)     AS light_hour,
-               MAX(CASE WHEN r_asc =1 THEN avg_co2 END)  AS light_hour_avg_co2
-        FROM ranked
-        GROUP BY taxi_type
-        ORDER BY taxi_type;
-    """
-    hour_stats = run_query(con, "Hour-of-day heavy/light (avg CO2 per trip)", hour_sql)
-
-    # 3) Day-of-week heavy/light (avg CO2 per trip)
-    dow_sql = core_cte + """
-        , stats AS (
-            SELECT taxi_type, day_of_week AS dow, AVG(trip_co2_kgs) AS avg_co2
-            FROM core
-            GROUP BY 1,2
-        ),
-        ranked AS (
-            SELECT *,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 DESC) AS r_desc,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 ASC)  AS r_asc
-            FROM stats
+    # 1-5) Largest trips, per-dimension heavy/light stats and monthly totals for the plot,
+    # as far as they were asked for
+    rollup = None
+    if ANALYSIS_ENGINE == "rollup":
+        try:
+            rollup = _qualify_table(con, ROLLUP_TABLE)
+            print_and_log(f"Using rollup: {rollup}")
+        except RuntimeError:
+            print_and_log(f"Rollup {ROLLUP_TABLE} not found (run dbt); using the trip-level view")
+
+    if ANALYSIS_PROFILE:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+
+    if ANALYSIS_CACHE_DIR:
+        _cache = result_cache.ResultCache(
+            ANALYSIS_CACHE_DIR, result_cache.data_fingerprint(con), ANALYSIS_CACHE_MAX_BYTES
         )
-        SELECT taxi_type,
-               MAX(CASE WHEN r_desc=1 THEN dow END)      AS heavy_dow,
-               MAX(CASE WHEN r_desc=1 THEN avg_co2 END)  AS heavy_dow_avg_co2,
-               MAX(CASE WHEN r_asc =1 THEN dow END)      AS light_dow,
-               MAX(CASE WHEN r_asc =1 THEN avg_co2 END)  AS light_dow_avg_co2
-        FROM ranked
-        GROUP BY taxi_type
-        ORDER BY taxi_type;
-    """
-    dow_stats = run_query(con, "Day-of-week heavy/light (avg CO2 per trip)", dow_sql)
 
-    # 4) Week-of-year heavy/light (avg CO2 per trip)
-    woy_sql = core_cte + """
-        , stats AS (
-            SELECT taxi_type, week_of_year AS woy, AVG(trip_co2_kgs) AS avg_co2
-            FROM core
-            GROUP BY 1,2
-        ),
-        ranked AS (
-            SELECT *,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 DESC) AS r_desc,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 ASC)  AS r_asc
-            FROM stats
-        )
-        SELECT taxi_type,
-               MAX(CASE WHEN r_desc=1 THEN woy END)      AS heavy_woy,
-               MAX(CASE WHEN r_desc=1 THEN avg_co2 END)  AS heavy_woy_avg_co2,
-               MAX(CASE WHEN r_asc =1 THEN woy END)      AS light_woy,
-               MAX(CASE WHEN r_asc =1 THEN avg_co2 END)  AS light_woy_avg_co2
-        FROM ranked
-        GROUP BY taxi_type
-        ORDER BY taxi_type;
-    """
-    woy_stats = run_query(con, "Week-of-year heavy/light (avg CO2 per trip)", woy_sql)
-
-    # 5) Month-of-year heavy/light (avg CO2 per trip)
-    moy_sql = core_cte + """
-        , stats AS (
-            SELECT taxi_type, month_of_year AS moy, AVG(trip_co2_kgs) AS avg_co2
-            FROM core
-            GROUP BY 1,2
-        ),
-        ranked AS (
-            SELECT *,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 DESC) AS r_desc,
-                   RANK() OVER (PARTITION BY taxi_type ORDER BY avg_co2 ASC)  AS r_asc
-            FROM stats
-        )
-        SELECT taxi_type,
-               MAX(CASE WHEN r_desc=1 THEN moy END)      AS heavy_moy,
-               MAX(CASE WHEN r_desc=1 THEN avg_co2 END)  AS heavy_moy_avg_co2,
-               MAX(CASE WHEN r_asc =1 THEN moy END)      AS light_moy,
-               MAX(CASE WHEN r_asc =1 THEN avg_co2 END)  AS light_moy_avg_co2
-        FROM ranked
-        GROUP BY taxi_type
-        ORDER BY taxi_type;
-    """
-    moy_stats = run_query(con, "Month-of-year heavy/light (avg CO2 per trip)", moy_sql)
-
-    # Monthly CO2 totals (for plot)
-    monthly_totals_sql = core_cte + """
-        SELECT
-            taxi_type,
-            DATE_TRUNC('month', pickup_ts) AS month,
-            SUM(trip_co2_kgs) AS total_co2_kg
-        FROM core
-        GROUP BY 1,2
-        ORDER BY month, taxi_type;
-    """
-    monthly = run_query(con, "Monthly CO2 totals by taxi type (for plotting)", monthly_totals_sql)
+    if rollup is not None:
+        results = _grouped_from_rollup(con, core_cte, rollup, sections)
+    elif ANALYSIS_ENGINE == "per_query":
+        results = _grouped_per_query(con, core_cte, sections)
+    else:
+        results = _grouped_single_scan(con, core_cte, sections)
 
     # -------------------------
     # Output (labeled)
     # -------------------------
-    print_and_log("===== LARGEST CARBON-PRODUCING TRIP BY TAXI TYPE (2015–2024) =====")
-    for _, r in largest.iterrows():
-        print_and_log(
-            f"{r['taxi_type']}: {r['trip_co2_kgs']:.3f} kg CO2 | "
-            f"pickup={r['pickup_ts']} | dist_mi={r['trip_distance']:.2f} | avg_mph={r['avg_mph']:.2f}"
-        )
-
-    print_and_log("\n===== HOUR OF DAY (avg CO2 per trip) =====")
-    for _, r in hour_stats.iterrows():
-        print_and_log(
-            f"{r['taxi_type']}: HEAVY hour={_fmt_int(r['heavy_hour'])} "
-            f"({r['heavy_hour_avg_co2']:.4f} kg) | "
-            f"LIGHT hour={_fmt_int(r['light_hour'])} "
-            f"({r['light_hour_avg_co2']:.4f} kg)"
-        )
-
-    print_and_log("\n===== DAY OF WEEK (avg CO2 per trip) =====")
-    for _, r in dow_stats.iterrows():
-        heavy = _dow_label(r['heavy_dow'])
-        light = _dow_label(r['light_dow'])
-        print_and_log(
-            f"{r['taxi_type']}: HEAVY day={heavy} "
-            f"({r['heavy_dow_avg_co2']:.4f} kg) | "
-            f"LIGHT day={light} "
-            f"({r['light_dow_avg_co2']:.4f} kg)"
-        )
-
-    print_and_log("\n===== WEEK OF YEAR (avg CO2 per trip) =====")
-    for _, r in woy_stats.iterrows():
-        print_and_log(
-            f"{r['taxi_type']}: HEAVY week={_fmt_int(r['heavy_woy'])} "
-            f"({r['heavy_woy_avg_co2']:.4f} kg) | "
-            f"LIGHT week={_fmt_int(r['light_woy'])} "
-            f"({r['light_woy_avg_co2']:.4f} kg)"
-        )
-
-    print_and_log("\n===== MONTH OF YEAR (avg CO2 per trip) =====")
-    for _, r in moy_stats.iterrows():
-        print_and_log(
-            f"{r['taxi_type']}: HEAVY month={_fmt_int(r['heavy_moy'])} "
-            f"({r['heavy_moy_avg_co2']:.4f} kg) | "
-            f"LIGHT month={_fmt_int(r['light_moy'])} "
-            f"({r['light_moy_avg_co2']:.4f} kg)"
-        )
+    if "largest" in results:
+        if TOP_K == 1:
+            print_and_log("===== LARGEST CARBON-PRODUCING TRIP BY TAXI TYPE (2015–2024) =====")
+        else:
+            print_and_log(f"===== TOP {TOP_K} CARBON-PRODUCING TRIPS BY TAXI TYPE (2015–2024) =====")
+        ranks = {}
+        for r in results['largest']:
+            ranks[r['taxi_type']] = ranks.get(r['taxi_type'], 0) + 1
+            rank = f" #{ranks[r['taxi_type']]}" if TOP_K > 1 else ""
+            print_and_log(
+                f"{r['taxi_type']}{rank}: {r['trip_co2_kgs']:.3f} kg CO2 | "
+                f"pickup={r['pickup_ts']} | dist_mi={r['trip_distance']:.2f} | avg_mph={r['avg_mph']:.2f}"
+            )
+
+    if "hour" in results:
+        print_and_log("\n===== HOUR OF DAY (avg CO2 per trip) =====")
+        for r in results['hour']:
+            print_and_log(
+                f"{r['taxi_type']}: HEAVY hour={_fmt_int(r['heavy_hour'])} "
+                f"({r['heavy_hour_avg_co2']:.4f} kg) | "
+                f"LIGHT hour={_fmt_int(r['light_hour'])} "
+                f"({r['light_hour_avg_co2']:.4f} kg)"
+            )
+
+    if "dow" in results:
+        print_and_log("\n===== DAY OF WEEK (avg CO2 per trip) =====")
+        for r in results['dow']:
+            heavy = _dow_label(r['heavy_dow'])
+            light = _dow_label(r['light_dow'])
+            print_and_log(
+                f"{r['taxi_type']}: HEAVY day={heavy} "
+                f"({r['heavy_dow_avg_co2']:.4f} kg) | "
+                f"LIGHT day={light} "
+                f"({r['light_dow_avg_co2']:.4f} kg)"
+            )
+
+    if "woy" in results:
+        print_and_log("\n===== WEEK OF YEAR (avg CO2 per trip) =====")
+        for r in results['woy']:
+            print_and_log(
+                f"{r['taxi_type']}: HEAVY week={_fmt_int(r['heavy_woy'])} "
+                f"({r['heavy_woy_avg_co2']:.4f} kg) | "
+                f"LIGHT week={_fmt_int(r['light_woy'])} "
+                f"({r['light_woy_avg_co2']:.4f} kg)"
+            )
+
+    if "moy" in results:
+        print_and_log("\n===== MONTH OF YEAR (avg CO2 per trip) =====")
+        for r in results['moy']:
+            print_and_log(
+                f"{r['taxi_type']}: HEAVY month={_fmt_int(r['heavy_moy'])} "
+                f"({r['heavy_moy_avg_co2']:.4f} kg) | "
+                f"LIGHT month={_fmt_int(r['light_moy'])} "
+                f"({r['light_moy_avg_co2']:.4f} kg)"
+            )
 
     # -------------------------
     # Plot
     # -------------------------
-    if monthly.empty:
-        print_and_log("No monthly data found to plot. Exiting before plot.")
-        return
-
-    print_and_log("Preparing monthly totals for plotting...")
-    monthly['month'] = pd.to_datetime(monthly['month'])
-    wide = monthly.pivot(index='month', columns='taxi_type', values='total_co2_kg').sort_index()
-    print_and_log(f"Monthly dataframe shape for plot: {wide.shape}")
-
-    print_and_log(f"Creating plot: {PLOT_FILE}")
-    plt.figure(figsize=(12, 5))
-    plt.plot(wide.index, wide.get('YELLOW'), label='YELLOW')
-    plt.plot(wide.index, wide.get('GREEN'), label='GREEN')
-    plt.title("Monthly CO2 Totals by Taxi Type (2015–2024)")
-    plt.xlabel("Month")
-    plt.ylabel("Total CO2 (kg)")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(PLOT_FILE, dpi=150)
-    plt.close()
-    print_and_log(f"Saved plot to: {PLOT_FILE}")
+    if "plot" in results:
+        if results["plot"].num_rows == 0:
+            print_and_log("No monthly data found to plot. Exiting before plot.")
+        elif _cache is not None and _cache.artifact_current(PLOT_FILE):
+            print_and_log(f"Plot {PLOT_FILE} is up to date with the data; not redrawn")
+        else:
+            _plot_monthly(results["plot"])
+            if _cache is not None:
+                _cache.record_artifact(PLOT_FILE)
+
+    if _cache is not None:
+        print_and_log(f"Result cache: {_cache.summary()}")
+
+    if ANALYSIS_PROFILE:
+        temp_dir = con.execute("SELECT current_setting('temp_directory')").fetchone()[0]
+        print_and_log(f"\n===== QUERY PROFILES ({PROFILE_DIR}/) =====")
+        if not _profiles:
+            print_and_log("No query was executed (all results came from the cache)")
+        for line in profiling.report(_profiles, temp_dir) if _profiles else []:
+            print_and_log(line)
+        with open(PROFILE_DIR / "summary.json", "w") as f:
+            json.dump(_profiles, f, indent=1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NYC taxi CO2 analysis (2015–2024)")
+    parser.add_argument(
+        "command", nargs="?", default="all", choices=SECTIONS + ("all",),
+        help="question to answer (default: all of them, plus the plot)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+        filename="analysis.log"
+    )
     try:
-        main()
+        main(SECTIONS if args.command == "all" else (args.command,))
     except Exception as e:
         logger.exception("Analysis failed")
         raise
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# ANALYSIS_ENGINE=per_query (seven independent scans of fct_trips_enriched) with the queries
+# run one after another (ANALYSIS_PARALLEL=1) and concurrently on cursors (2, 4), over a
+# synthetic table of BENCH_ROWS trips with the result cache off. Reports the median wall time
+# of the query phase over BENCH_REPEATS fresh processes, and the summed queue time.
+#
+#   BENCH_ROWS=20000000 DUCKDB_THREADS=8 python benchmarks/analysis_parallel.py
+
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import duckdb
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSIS = os.path.join(REPO, "analysis.py")
+ROWS = int(os.environ.get("BENCH_ROWS", "5000000"))
+REPEATS = int(os.environ.get("BENCH_REPEATS", "3"))
+PARALLEL = (1, 2, 4)
+
+def _make_db(path: str) -> None:
+    con = duckdb.connect(path)
+    con.execute(f"""
+        CREATE TABLE fct_trips_enriched AS
+        SELECT CASE WHEN i % 3 = 0 THEN 'GREEN' ELSE 'YELLOW' END AS taxi_type,
+               TIMESTAMP '2015-01-01' + to_seconds(i * (315532800 // {ROWS})) AS pickup_ts,
+               (hash(i) % 2000) / 100.0 AS trip_distance,
+               (hash(i + 1) % 4000) / 100.0 AS avg_mph,
+               (hash(i) % 2000) / 100.0 * 0.41 AS trip_co2_kgs,
+               hour(pickup_ts) AS hour_of_day,
+               dayofweek(pickup_ts) AS day_of_week,
+               week(pickup_ts) AS week_of_year,
+               month(pickup_ts) AS month_of_year
+        FROM range({ROWS}) r(i);
+    """)
+    con.close()
+
+def _run(parallel: int, cwd: str):
+    """(query phase seconds, summed queue seconds) for one fresh process."""
+    out = subprocess.run(
+        [sys.executable, ANALYSIS, "all"], cwd=cwd, capture_output=True, text=True, check=True,
+        env=dict(os.environ, ANALYSIS_ENGINE="per_query", ANALYSIS_PARALLEL=str(parallel),
+                 ANALYSIS_CACHE_DIR="", MPLBACKEND="Agg"),
+    ).stdout
+    ends = re.findall(r"^END: .*\| ([\d.]+)s \| queued ([\d.]+)s", out, re.M)
+    done = re.search(r"queries done in ([\d.]+)s", out)
+    phase = float(done.group(1)) if done else sum(float(e) for e, _ in ends)
+    return phase, sum(float(q) for _, q in ends)
+
+def main():
+    with tempfile.TemporaryDirectory() as work:
+        _make_db(os.path.join(work, "emissions.duckdb"))
+        print(f"{ROWS:,} trips, {os.cpu_count()} CPUs, median of {REPEATS}\n")
+        print(f"{'ANALYSIS_PARALLEL':>18}{'queries (s)':>13}{'queued (s)':>12}")
+        for parallel in PARALLEL:
+            samples = [_run(parallel, work) for _ in range(REPEATS)]
+            phase = statistics.median(s[0] for s in samples)
+            queued = statistics.median(s[1] for s in samples)
+            print(f"{parallel:>18}{phase:>13.2f}{queued:>12.2f}")
+
+if __name__ == "__main__":
+    main()
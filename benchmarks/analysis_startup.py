@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Cold start of analysis.py, measured with python -X importtime over a small synthetic
+# fct_trips_enriched (so the query time is negligible next to start-up):
+#   import only   `import analysis` (must not create analysis.log or plots/)
+#   hour (eager)  text-only question with pandas and matplotlib imported up front, as the
+#                 module used to do at load
+#   hour          text-only question (no pandas, no matplotlib)
+#   plot          monthly totals and the plot (matplotlib loaded on demand)
+# Reports the median total import time and wall time over BENCH_REPEATS fresh processes.
+#
+#   BENCH_REPEATS=9 python benchmarks/analysis_startup.py
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import duckdb
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSIS = os.path.join(REPO, "analysis.py")
+REPEATS = int(os.environ.get("BENCH_REPEATS", "5"))
+
+RUNS = {
+    "import only":  ["-c", "import analysis"],
+    "hour (eager)": ["-c", "import sys, runpy, pandas, matplotlib.pyplot; sys.argv = ['analysis.py', 'hour']; "
+                           f"runpy.run_path({ANALYSIS!r}, run_name='__main__')"],
+    "hour":         [ANALYSIS, "hour"],
+    "plot":         [ANALYSIS, "plot"],
+}
+
+def _make_db(path: str) -> None:
+    con = duckdb.connect(path)
+    con.execute("""
+        CREATE TABLE fct_trips_enriched AS
+        SELECT CASE WHEN i % 2 = 0 THEN 'YELLOW' ELSE 'GREEN' END AS taxi_type,
+               TIMESTAMP '2016-01-01' + to_seconds(i * 97) AS pickup_ts,
+               (i % 50) / 10.0 + 0.1 AS trip_distance,
+               12.5 AS avg_mph,
+               ((i % 50) / 10.0 + 0.1) * 0.4 AS trip_co2_kgs,
+               hour(pickup_ts) AS hour_of_day,
+               dayofweek(pickup_ts) AS day_of_week,
+               week(pickup_ts) AS week_of_year,
+               month(pickup_ts) AS month_of_year
+        FROM range(100000) r(i);
+    """)
+    con.close()
+
+def _run(args, cwd: str):
+    """(total import ms, wall ms, heavy modules loaded) for one fresh process."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=cwd, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=REPO, MPLBACKEND="Agg"), check=True,
+    )
+    wall = (time.perf_counter() - t0) * 1000
+    total_us, heavy = 0, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        top = name.strip().split(".")[0]
+        if top in ("pandas", "matplotlib"):
+            heavy.add(top)
+    return total_us / 1000, wall, heavy
+
+def main():
+    with tempfile.TemporaryDirectory() as work:
+        _make_db(os.path.join(work, "emissions.duckdb"))
+        print(f"{'run':14}{'imports (ms)':>14}{'wall (ms)':>11}  heavy modules")
+        for label, args in RUNS.items():
+            samples = [_run(args, work) for _ in range(REPEATS)]
+            imports = statistics.median(s[0] for s in samples)
+            wall = statistics.median(s[1] for s in samples)
+            heavy = ", ".join(sorted(samples[0][2])) or "-"
+            print(f"{label:14}{imports:>14.0f}{wall:>11.0f}  {heavy}")
+            if label == "import only":
+                leftovers = sorted(set(os.listdir(work)) - {"emissions.duckdb"})
+                print(f"{'':14}files created by the import: {', '.join(leftovers) or 'none'}")
+
+if __name__ == "__main__":
+    main()
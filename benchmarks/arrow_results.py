@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Fetching a large drill-down series (CO2 per day per pickup zone) for plotting:
+#   pandas  .df(), pd.to_datetime and pivot, then one column per zone (the old analysis.py path)
+#   arrow   to_arrow_table(), then NumPy views of the day/CO2 buffers split per zone (the new path)
+#
+# Each path runs in a fresh process over the same in-memory table, so the peak RSS it adds
+# over the table itself is comparable; the best of BENCH_REPEATS wall times is reported.
+#
+#   BENCH_DAYS=3653 BENCH_ZONES=265 python benchmarks/arrow_results.py
+
+import os
+import resource
+import subprocess
+import sys
+import time
+
+DAYS    = int(os.environ.get("BENCH_DAYS", "3653"))      # 2015-01-01 .. 2024-12-31
+ZONES   = int(os.environ.get("BENCH_ZONES", "265"))      # TLC taxi zones
+REPEATS = int(os.environ.get("BENCH_REPEATS", "3"))
+
+SERIES_SQL = """
+    SELECT zone, day, co2_kg
+    FROM daily
+    ORDER BY zone, day
+"""
+
+def _pandas(con):
+    import pandas as pd
+    df = con.execute(SERIES_SQL).df()
+    df["day"] = pd.to_datetime(df["day"])
+    wide = df.pivot(index="day", columns="zone", values="co2_kg").sort_index()
+    x = wide.index.to_numpy()
+    return {zone: (x, wide[zone].to_numpy()) for zone in wide.columns}
+
+def _arrow(con):
+    import numpy as np
+    tbl = con.execute(SERIES_SQL).to_arrow_table()
+    zone = tbl["zone"].to_numpy()
+    cuts = np.flatnonzero(zone[1:] != zone[:-1]) + 1
+    days = np.split(tbl["day"].to_numpy(), cuts)
+    co2 = np.split(tbl["co2_kg"].to_numpy(), cuts)
+    return {int(z[0]): (d, c) for z, d, c in zip(np.split(zone, cuts), days, co2)}
+
+def _child(path: str):
+    import duckdb
+    import numpy as np     # noqa: F401  (both paths pay the same imports before the baseline)
+    import pandas          # noqa: F401
+    import pyarrow         # noqa: F401
+
+    con = duckdb.connect()
+    con.execute(f"""
+        CREATE TABLE daily AS
+        SELECT z.zone::INTEGER AS zone,
+               DATE '2015-01-01' + d.day::INTEGER AS day,
+               (hash(z.zone, d.day) % 100000) / 10.0 AS co2_kg
+        FROM range(1, {ZONES} + 1) z(zone), range({DAYS}) d(day);
+    """)
+    fn = _pandas if path == "pandas" else _arrow
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        series = fn(con)
+        best = min(best, time.perf_counter() - t0)
+        del series
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print(f"{best:.4f} {peak}")
+
+def main():
+    if len(sys.argv) > 1:
+        _child(sys.argv[1])
+        return
+    print(f"Series: {DAYS:,} days x {ZONES} zones = {DAYS * ZONES:,} rows, best of {REPEATS}\n")
+    print(f"{'path':10}{'time (s)':>10}{'peak RSS added (MiB)':>24}")
+    for path in ("pandas", "arrow"):
+        out = subprocess.run([sys.executable, __file__, path], capture_output=True, text=True, check=True).stdout
+        seconds, peak_kib = out.split()
+        print(f"{path:10}{float(seconds):>10.3f}{int(peak_kib) / 1024:>24.1f}")
+
+if __name__ == "__main__":
+    main()
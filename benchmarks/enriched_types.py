@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Before/after report for the compact column types in fct_trips_enriched:
+# taxi_type VARCHAR -> ENUM('YELLOW', 'GREEN') and the four extract() features BIGINT -> UTINYINT.
+#
+# Builds the same synthetic trips twice in throwaway DuckDB files and prints the file size,
+# the on-disk and in-memory bytes of the changed columns and the time of analysis.py's grouped scan.
+#
+#   BENCH_ROWS=20000000 python benchmarks/enriched_types.py
+
+import os
+import tempfile
+import time
+
+import duckdb
+
+ROWS    = int(os.environ.get("BENCH_ROWS", "10000000"))
+REPEATS = int(os.environ.get("BENCH_REPEATS", "5"))
+THREADS = int(os.environ.get("DUCKDB_THREADS", "4"))
+
+CHANGED_COLS = ["taxi_type", "hour_of_day", "day_of_week", "week_of_year", "month_of_year"]
+
+# Synthetic trips spread over 2015-2024, same columns as the mart
+TRIPS_SQL = f"""
+    SELECT CASE WHEN random() < 0.7 THEN 'YELLOW' ELSE 'GREEN' END AS taxi_type,
+           TIMESTAMP '2015-01-01' + to_seconds(CAST(floor(random() * 315532800) AS BIGINT)) AS pickup_ts,
+           round(random() * random() * 30, 2) AS trip_distance,
+           CAST(60 + floor(random() * 3600) AS INT) AS trip_seconds
+    FROM range({ROWS})
+"""
+
+def _enriched_sql(compact: bool) -> str:
+    taxi = "taxi_type::enum('YELLOW', 'GREEN')" if compact else "taxi_type"
+    cast = "::utinyint" if compact else ""
+    return f"""
+        SELECT {taxi} AS taxi_type,
+               pickup_ts,
+               pickup_ts + to_seconds(trip_seconds) AS dropoff_ts,
+               1 AS passenger_count,
+               trip_distance,
+               trip_seconds / 60.0 AS trip_duration_minutes,
+               trip_seconds / 3600.0 AS trip_duration_hours,
+               trip_distance / (trip_seconds / 3600.0) AS avg_mph,
+               trip_distance * CASE taxi_type WHEN 'YELLOW' THEN 404.0 ELSE 380.0 END / 1000.0 AS trip_co2_kgs,
+               extract('hour'  FROM pickup_ts){cast} AS hour_of_day,
+               extract('dow'   FROM pickup_ts){cast} AS day_of_week,
+               extract('week'  FROM pickup_ts){cast} AS week_of_year,
+               extract('month' FROM pickup_ts){cast} AS month_of_year
+        FROM trips
+    """
+
+# The grouped scan analysis.py runs over the mart
+SCAN_SQL = """
+    SELECT taxi_type, hour_of_day, day_of_week, week_of_year, month_of_year,
+           SUM(trip_co2_kgs), COUNT(trip_co2_kgs)
+    FROM fct_trips_enriched
+    GROUP BY GROUPING SETS ((taxi_type, hour_of_day), (taxi_type, day_of_week),
+                            (taxi_type, week_of_year), (taxi_type, month_of_year))
+"""
+
+def _build(path: str, compact: bool) -> None:
+    con = duckdb.connect(path)
+    con.execute(f"SET threads={THREADS};")
+    con.execute(f"CREATE TABLE trips AS {TRIPS_SQL};")
+    con.execute(f"CREATE TABLE fct_trips_enriched AS {_enriched_sql(compact)};")
+    con.execute("DROP TABLE trips;")
+    con.close()
+    # Reclaim the dropped staging table so the file size reflects the mart alone
+    con = duckdb.connect(path)
+    con.execute("VACUUM;")
+    con.execute("CHECKPOINT;")
+    con.close()
+
+def _features_bytes(con, tmp: str, label: str) -> int:
+    """File size of a database holding only the changed columns (their share of the mart)."""
+    path = os.path.join(tmp, f"{label}-features.duckdb")
+    con.execute(f"ATTACH '{path}' AS features;")
+    con.execute(f"CREATE TABLE features.t AS SELECT {', '.join(CHANGED_COLS)} FROM fct_trips_enriched;")
+    con.execute("DETACH features;")
+    return os.path.getsize(path)
+
+def _in_memory_bytes(con) -> int:
+    """Bytes of the changed columns once read out of storage (what a scan hands to operators/clients)."""
+    result = con.execute(f"SELECT {', '.join(CHANGED_COLS)} FROM fct_trips_enriched").arrow()
+    # .arrow() returns a Table on older DuckDB releases and a RecordBatchReader on newer ones
+    table = result.read_all() if hasattr(result, "read_all") else result
+    return table.nbytes
+
+def _compression(con) -> dict:
+    rows = con.execute("""
+        SELECT column_name, string_agg(DISTINCT compression, '/' ORDER BY compression)
+        FROM pragma_storage_info('fct_trips_enriched')
+        WHERE segment_type <> 'VALIDITY'
+        GROUP BY 1
+    """).fetchall()
+    return dict(rows)
+
+def _scan_seconds(con) -> float:
+    con.execute(SCAN_SQL).fetchall()  # warm the buffer pool
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        con.execute(SCAN_SQL).fetchall()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    print(f"Synthetic fct_trips_enriched: {ROWS:,} rows, threads={THREADS}, best of {REPEATS} scans")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, compact in (("before (VARCHAR/BIGINT)", False), ("after (ENUM/UTINYINT)", True)):
+            path = os.path.join(tmp, f"{'after' if compact else 'before'}.duckdb")
+            _build(path, compact)
+            con = duckdb.connect(path)
+            con.execute(f"SET threads={THREADS};")
+            results[label] = {
+                "file": os.path.getsize(path),
+                "features": _features_bytes(con, tmp, "after" if compact else "before"),
+                "memory": _in_memory_bytes(con),
+                "compression": _compression(con),
+                "scan": _scan_seconds(con),
+            }
+            con.close()
+
+    (before_label, before), (after_label, after) = results.items()
+    pct = lambda key: (after[key] / before[key] - 1) * 100
+    print(f"\n{'':26}{'file size':>12}{'5 cols disk':>13}{'5 cols mem':>13}{'scan (s)':>10}")
+    for label, r in results.items():
+        print(
+            f"{label:26}{r['file'] / 2**20:>8.1f} MiB{r['features'] / 2**20:>9.1f} MiB"
+            f"{r['memory'] / 2**20:>9.1f} MiB{r['scan']:>10.3f}"
+        )
+    print(f"{'change':26}{pct('file'):>11.1f}%{pct('features'):>12.1f}%{pct('memory'):>12.1f}%{pct('scan'):>9.1f}%")
+
+    print(f"\nCompression per changed column ({before_label} -> {after_label}):")
+    for col in CHANGED_COLS:
+        print(f"  {col:15} {before['compression'][col]:>22} -> {after['compression'][col]}")
+
+if __name__ == "__main__":
+    main()
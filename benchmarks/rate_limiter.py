@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# load.py against a local HTTP stand-in for the TLC CloudFront bucket that injects failures:
+# more than SERVER_CAPACITY requests in any second get a 429 (with Retry-After), and a share
+# of the rest get a 503 or a dropped connection. A few months of synthetic trips are served;
+# every other month is a 404, as before a month is published.
+#
+# Runs a loader (sequential, fresh database each time) twice:
+#   fixed     load.py as it was before ratelimit.py was added, exported from git history:
+#             SLEEP_SECONDS after every month, requests within a month unpaced, no retries
+#             (a failed month is skipped until the next run)
+#   adaptive  the current load.py: AIMD limiter starting at 1/SLEEP_SECONDS with bounded,
+#             jittered retries (a 1 req/s floor and short backoffs so the run stays short)
+# Both use the same SLEEP_SECONDS (BENCH_SLEEP). Reports months loaded, wall time, the
+# request rate the server saw, retries and the server's outcomes. Needs a git checkout.
+#
+#   BENCH_MONTHS=6 SERVER_CAPACITY=15 python benchmarks/rate_limiter.py
+
+import http.server
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+
+import duckdb
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MONTHS          = int(os.environ.get("BENCH_MONTHS", "6"))          # 2016-01.. served per taxi type
+ROWS            = int(os.environ.get("BENCH_ROWS", "20000"))        # rows per served month
+SERVER_CAPACITY = int(os.environ.get("SERVER_CAPACITY", "15"))      # requests per second before 429s
+FAIL_RATE       = float(os.environ.get("FAIL_RATE", "0.05"))        # 503s
+DROP_RATE       = float(os.environ.get("DROP_RATE", "0.02"))        # connections closed without a response
+CLIENT_MAX_RPS  = os.environ.get("CLIENT_MAX_RPS", "40")                # adaptive ceiling
+SLEEP           = os.environ.get("BENCH_SLEEP", "0.5")                   # SLEEP_SECONDS for both
+SEED            = int(os.environ.get("BENCH_SEED", "7"))
+RUN_TIMEOUT     = float(os.environ.get("BENCH_TIMEOUT", "600"))     # seconds per load.py run
+
+POLICIES = ("fixed", "adaptive")
+
+class StandIn(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root: str):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.root = root
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.stats = Counter()
+        self.rng = random.Random(SEED)
+
+    def verdict(self) -> str:
+        """'ok', '429', '503' or 'drop' for the next request."""
+        with self.lock:
+            now = time.monotonic()
+            while self.window and self.window[0] < now - 1.0:
+                self.window.popleft()
+            self.window.append(now)
+            self.stats["requests"] += 1
+            if len(self.window) > SERVER_CAPACITY:
+                outcome = "429"
+            else:
+                r = self.rng.random()
+                outcome = "503" if r < FAIL_RATE else "drop" if r < FAIL_RATE + DROP_RATE else "ok"
+            self.stats[outcome] += 1
+            return outcome
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _serve(self, body: bool):
+        outcome = self.server.verdict()
+        if outcome == "drop":
+            self.close_connection = True
+            self.connection.close()
+            return
+        if outcome in ("429", "503"):
+            self.send_response(int(outcome))
+            if outcome == "429":
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = os.path.join(self.server.root, os.path.basename(self.path))
+        if not os.path.exists(path):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        status, start, end = 200, 0, len(data) - 1
+        m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if m:
+            status, start = 206, int(m.group(1))
+            end = min(int(m.group(2)), end) if m.group(2) else end
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{os.path.getsize(path)}-{int(os.path.getmtime(path))}"')
+        self.send_header("Last-Modified", self.date_time_string(os.path.getmtime(path)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start:end + 1])
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+def _write_months(root: str) -> None:
+    con = duckdb.connect()
+    for taxi, prefix in (("yellow", "tpep"), ("green", "lpep")):
+        for m in range(1, MONTHS + 1):
+            con.execute(f"""
+                COPY (
+                    SELECT TIMESTAMP '2016-{m:02d}-01' + to_seconds(i * 60) AS {prefix}_pickup_datetime,
+                           TIMESTAMP '2016-{m:02d}-01' + to_seconds(i * 60 + 600) AS {prefix}_dropoff_datetime,
+                           1 AS passenger_count, (i % 50) / 10.0 + 0.1 AS trip_distance
+                    FROM range({ROWS}) r(i)
+                ) TO '{os.path.join(root, f"{taxi}_tripdata_2016-{m:02d}.parquet")}' (FORMAT PARQUET);
+            """)
+    con.close()
+
+def _legacy_tree(work: str) -> str:
+    """The repo as of the commit before the one that added ratelimit.py (the fixed-sleep loader)."""
+    added = subprocess.run(
+        ["git", "log", "--diff-filter=A", "--format=%H", "--", "ratelimit.py"],
+        cwd=REPO, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    if not added:
+        raise RuntimeError("ratelimit.py not found in git history; the fixed baseline needs a git checkout")
+    tree = os.path.join(work, "legacy")
+    os.makedirs(tree)
+    archive = subprocess.run(["git", "archive", f"{added[-1]}^"], cwd=REPO, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+    return tree
+
+def _run(policy: str, tree: str, server: StandIn, work: str):
+    run_dir = os.path.join(work, policy)
+    os.makedirs(run_dir)
+    os.symlink(os.path.join(tree, "data"), os.path.join(run_dir, "data"))
+    env = dict(
+        os.environ,
+        TLC_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}",
+        DB_PATH=os.path.join(run_dir, "bench.duckdb"),
+        LOAD_WORKERS="1",
+        LOAD_MAX_RPS=CLIENT_MAX_RPS,
+        SLEEP_SECONDS=SLEEP,
+        LOAD_BACKOFF_BASE="0.5",
+        LOAD_BACKOFF_MAX="5",
+        LOAD_MIN_RPS="1",
+        PYTHONPATH=tree,
+    )
+    server.stats.clear()
+    t0 = time.perf_counter()
+    try:
+        subprocess.run(
+            [sys.executable, os.path.join(tree, "load.py")], cwd=run_dir, env=env,
+            capture_output=True, text=True, timeout=RUN_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        pass
+    elapsed = time.perf_counter() - t0
+
+    # A run that gave up (no reachable months) or timed out may have no manifest yet
+    try:
+        con = duckdb.connect(env["DB_PATH"], read_only=True)
+        loaded = con.execute("SELECT COUNT(*) FROM load_manifest WHERE status = 'loaded'").fetchone()[0]
+        con.close()
+    except duckdb.Error:
+        loaded = 0
+    log = os.path.join(run_dir, "load.log")
+    retries = 0
+    if os.path.exists(log):
+        with open(log) as f:
+            retries = sum("RETRY" in line for line in f)
+    # Rate as the server saw it, so both loaders are measured the same way
+    stats = dict(server.stats)
+    rps = stats.get("requests", 0) / elapsed if elapsed > 0 else 0.0
+    return {"loaded": loaded, "elapsed": elapsed, "retries": retries, "rps": rps, "server": stats}
+
+def main():
+    with tempfile.TemporaryDirectory() as work:
+        trees = {"fixed": _legacy_tree(work), "adaptive": REPO}
+        root = os.path.join(work, "tlc")
+        os.makedirs(root)
+        _write_months(root)
+        server = StandIn(root)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        print(
+            f"Stand-in: {2 * MONTHS} months served, capacity {SERVER_CAPACITY} req/s, "
+            f"{FAIL_RATE:.0%} 503s, {DROP_RATE:.0%} dropped connections; SLEEP_SECONDS={SLEEP}, "
+            f"adaptive max {CLIENT_MAX_RPS} req/s"
+        )
+        print(f"\n{'policy':10}{'months':>10}{'time (s)':>10}{'req/s':>8}{'retries':>9}"
+              f"{'requests':>10}{'429':>6}{'503':>6}{'drop':>6}")
+        for policy in POLICIES:
+            r = _run(policy, trees[policy], server, work)
+            s, months = r["server"], f"{r['loaded']}/{2 * MONTHS}"
+            print(
+                f"{policy:10}{months:>10}{r['elapsed']:>10.1f}{r['rps']:>8.2f}"
+                f"{r['retries']:>9}{s.get('requests', 0):>10}{s.get('429', 0):>6}{s.get('503', 0):>6}{s.get('drop', 0):>6}"
+            )
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Row groups skipped by DuckDB's min/max zone maps when trips are stored in load order
+# versus clustered by (taxi_type, pickup_ts), as clean.py and the marts now write them.
+#
+# Synthetic trips are written in load order (concurrently loaded months interleaved, batches
+# out of calendar order, a share of rows from a resumed run at the end), then copied with
+# ORDER BY taxi_type, pickup_ts. Row groups read are those whose pickup_ts zone map overlaps
+# the filter; rows scanned come from the JSON profiler.
+#
+#   BENCH_ROWS=20000000 python benchmarks/zonemap_pruning.py
+
+import json
+import os
+import tempfile
+import time
+
+import duckdb
+
+ROWS    = int(os.environ.get("BENCH_ROWS", "10000000"))
+THREADS = int(os.environ.get("DUCKDB_THREADS", "4"))
+LOAD_WORKERS = int(os.environ.get("LOAD_WORKERS", "4"))  # months written concurrently, so interleaved
+
+# Same pickup_ts ranges as fct_trips_enriched_sample and a per-year / per-month analysis
+QUERIES = {
+    "sample day 2015-01-01": ("2015-01-01", "2015-01-02"),
+    "month 2020-03":         ("2020-03-01", "2020-04-01"),
+    "year 2019":             ("2019-01-01", "2020-01-01"),
+}
+
+# Load order: batches of LOAD_WORKERS months in shuffled order with their rows (and taxi types)
+# interleaved, plus ~5% of rows arriving in a later, resumed batch
+LOAD_ORDER_SQL = f"""
+    SELECT CASE WHEN random() < 0.7 THEN 'YELLOW' ELSE 'GREEN' END AS taxi_type,
+           TIMESTAMP '2015-01-01' + to_seconds(CAST(floor(random() * 315532800) AS BIGINT)) AS pickup_ts,
+           round(random() * random() * 30, 2) AS trip_distance,
+           random() < 0.05 AS late
+    FROM range({ROWS})
+"""
+
+def _rows_scanned(profile: dict) -> int:
+    total = profile.get("operator_rows_scanned", 0) if "SCAN" in (profile.get("operator_name") or "") else 0
+    return total + sum(_rows_scanned(child) for child in profile.get("children", []))
+
+def _row_groups_read(con, table: str, lo: str, hi: str):
+    """(row groups whose pickup_ts min/max overlap [lo, hi), total row groups) from the zone maps."""
+    return con.execute(f"""
+        WITH seg AS (
+            SELECT row_group_id,
+                   CAST(regexp_extract(stats, 'Min: ([^,]+),', 1) AS TIMESTAMP) AS lo,
+                   CAST(regexp_extract(stats, 'Max: ([^\\]]+)\\]', 1) AS TIMESTAMP) AS hi
+            FROM pragma_storage_info('{table}')
+            WHERE column_name = 'pickup_ts' AND segment_type <> 'VALIDITY'
+        ),
+        rg AS (SELECT row_group_id, MIN(lo) AS lo, MAX(hi) AS hi FROM seg GROUP BY 1)
+        SELECT COUNT(*) FILTER (WHERE hi >= TIMESTAMP '{lo}' AND lo < TIMESTAMP '{hi}'), COUNT(*)
+        FROM rg;
+    """).fetchone()
+
+def _run(con, table: str, lo: str, hi: str, prof_path: str):
+    con.execute("PRAGMA enable_profiling='json';")
+    con.execute(f"PRAGMA profiling_output='{prof_path}';")
+    t0 = time.perf_counter()
+    con.execute(f"""
+        SELECT taxi_type, COUNT(*), SUM(trip_distance)
+        FROM {table}
+        WHERE pickup_ts >= TIMESTAMP '{lo}' AND pickup_ts < TIMESTAMP '{hi}'
+        GROUP BY 1;
+    """).fetchall()
+    elapsed = time.perf_counter() - t0
+    con.execute("PRAGMA disable_profiling;")
+    with open(prof_path) as f:
+        return _rows_scanned(json.load(f)), elapsed
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        con = duckdb.connect(os.path.join(tmp, "bench.duckdb"))
+        con.execute(f"SET threads={THREADS};")
+        # preserve_insertion_order keeps each CTAS in the order written below
+        con.execute(f"""
+            CREATE TABLE load_order AS
+            WITH t AS ({LOAD_ORDER_SQL})
+            SELECT taxi_type, pickup_ts, trip_distance FROM t
+            ORDER BY late, hash(date_diff('month', TIMESTAMP '2015-01-01', pickup_ts) // {LOAD_WORKERS}), random();
+        """)
+        con.execute("CREATE TABLE clustered AS SELECT * FROM load_order ORDER BY taxi_type, pickup_ts;")
+        con.execute("CHECKPOINT;")
+
+        print(f"Synthetic trips: {ROWS:,} rows, threads={THREADS}")
+        print(f"\n{'query':24}{'table':12}{'row groups read':>17}{'pruned':>8}{'rows scanned':>14}{'time (s)':>10}")
+        for label, (lo, hi) in QUERIES.items():
+            for table in ("load_order", "clustered"):
+                read, total = _row_groups_read(con, table, lo, hi)
+                _run(con, table, lo, hi, os.path.join(tmp, "warm.json"))  # warm the buffer pool
+                scanned, elapsed = _run(con, table, lo, hi, os.path.join(tmp, "profile.json"))
+                print(f"{label:24}{table:12}{f'{read}/{total}':>17}{1 - read / total:>8.0%}{scanned:>14,}{elapsed:>10.3f}")
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Checkpoint policy shared by load.py and clean.py.
+#
+# Every committed transaction is already durable in the WAL (the load manifest and the dedup
+# progress table are written in the same transaction as the data they describe), so a
+# checkpoint only folds the WAL into the database file. Forcing one after every month or rule
+# rewrites the dirty blocks each time; instead a stage reports each committed unit of work and
+# the policy checkpoints when it is due:
+#
+#   CHECKPOINT_EVERY=bytes   when the WAL has reached CHECKPOINT_WAL_BYTES (default)
+#   CHECKPOINT_EVERY=time    when CHECKPOINT_SECONDS have passed since the last one
+#   CHECKPOINT_EVERY=stage   only at the end of the stage
+#   CHECKPOINT_EVERY=unit    after every unit (the old behaviour)
+#
+# DuckDB's own automatic checkpoint (checkpoint_threshold, 16 MiB by default) is raised to
+# CHECKPOINT_WAL_BYTES, or to CHECKPOINT_WAL_MAX for the time and stage policies, so it does
+# not undo the batching; the latter also bounds how much WAL a crash has to replay.
+
+import logging
+import os
+import time
+
+import duckdb
+
+import planner
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_EVERY     = os.environ.get("CHECKPOINT_EVERY", "bytes")
+CHECKPOINT_WAL_BYTES = planner.parse_bytes(os.environ.get("CHECKPOINT_WAL_BYTES", "256MiB"))
+CHECKPOINT_SECONDS   = float(os.environ.get("CHECKPOINT_SECONDS", "300"))
+CHECKPOINT_WAL_MAX   = planner.parse_bytes(os.environ.get("CHECKPOINT_WAL_MAX", "4GiB"))
+
+POLICIES = ("bytes", "time", "stage", "unit")
+
+class CheckpointPolicy:
+    """
+    Checkpoints for one stage on con. after() is called once a unit of work has committed,
+    end() when the stage is done; both log what they ran, end() the stage's totals.
+    force=False uses a plain CHECKPOINT, which is deferred rather than aborting the
+    transactions of other cursors (parallel cleaning).
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, stage: str, every: str = CHECKPOINT_EVERY, force: bool = True):
+        if every not in POLICIES:
+            raise ValueError(f"Unknown CHECKPOINT_EVERY={every!r} (expected one of {', '.join(POLICIES)})")
+        self.con, self.stage, self.every, self.force = con, stage, every, force
+        path = con.execute(
+            "SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+        ).fetchone()[0]
+        self.wal_path = path + ".wal" if path else None
+        self.count = 0
+        self.deferred = 0
+        self.seconds = 0.0
+        self.pending = 0
+        self._last = time.monotonic()
+        if every != "unit":
+            threshold = CHECKPOINT_WAL_BYTES if every == "bytes" else CHECKPOINT_WAL_MAX
+            con.execute(f"SET checkpoint_threshold='{threshold}B';")
+
+    def wal_bytes(self) -> int:
+        if self.wal_path and os.path.exists(self.wal_path):
+            return os.path.getsize(self.wal_path)
+        return 0
+
+    def _due(self) -> bool:
+        if self.every == "unit":
+            return True
+        if self.every == "bytes":
+            return self.wal_bytes() >= CHECKPOINT_WAL_BYTES
+        if self.every == "time":
+            return time.monotonic() - self._last >= CHECKPOINT_SECONDS
+        return False
+
+    def _run(self, label: str) -> bool:
+        wal = self.wal_bytes()
+        t0 = time.perf_counter()
+        if self.force:
+            self.con.execute("PRAGMA force_checkpoint;")
+        else:
+            try:
+                self.con.execute("CHECKPOINT;")
+            except duckdb.TransactionException:
+                self.deferred += 1
+                logger.info(f"{self.stage}: checkpoint after {label} deferred (another cursor is writing)")
+                return False
+        elapsed = time.perf_counter() - t0
+        self.count += 1
+        self.seconds += elapsed
+        self.pending = 0
+        self._last = time.monotonic()
+        logger.info(f"{self.stage}: checkpoint after {label} ({planner.fmt_bytes(wal)} WAL) in {elapsed:.2f}s")
+        return True
+
+    def after(self, label: str) -> None:
+        self.pending += 1
+        if self._due():
+            self._run(label)
+
+    def end(self, label: str = "end of stage") -> None:
+        if self.pending or self.wal_bytes():
+            self._run(label)
+        logger.info(self.summary())
+
+    def summary(self) -> str:
+        return (
+            f"{self.stage}: {self.count} checkpoints in {self.seconds:.2f}s "
+            f"(CHECKPOINT_EVERY={self.every}, {self.deferred} deferred)"
+        )
@@ -1,23 +1,30 @@
 #!/usr/bin/env python3
 
-# After many tries, I did not end up dropping all duplicates because my program crashed every time due to insufficient disk space
+# Duplicates are removed one (taxi_type, pickup month) partition at a time: a global DISTINCT
+# crashed every time due to insufficient disk space
 
 # Importing libraries
 import duckdb
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import (
+    COMMON_KEEP_COLS, LOAD_MANIFEST, RAW_PARTS_SCHEMA, YEAR_MIN, YEAR_MAX, reject_case, rule_predicates,
+)
+import checkpoints
+import compact
+import lake
+import planner
 
 
 # Setting up constants and environment variables
 
 DB_PATH = os.environ.get("DB_PATH", "emissions.duckdb")
-YEAR_MIN, YEAR_MAX = 2015, 2024  
 
-# Tuning to try to reduce usage, but was still unable to get drop duplicates to work
-DUCKDB_TEMP_DIR   = os.environ.get("DUCKDB_TEMP_DIR", "")     
-MAX_TEMP_DIR_SIZE = os.environ.get("MAX_TEMP_DIR_SIZE", "50GiB") 
-MEMORY_LIMIT      = os.environ.get("MEMORY_LIMIT", "8GB")        
-THREADS           = os.environ.get("DUCKDB_THREADS", "4")         
+# memory_limit, threads and temp space are chosen by planner.py before the stages run
+# (MEMORY_LIMIT, DUCKDB_THREADS, MAX_TEMP_DIR_SIZE and DUCKDB_TEMP_DIR still override it)
 
 # Raw (from load.py)
 YELLOW_RAW = "raw_yellow_all"
@@ -27,11 +34,33 @@ GREEN_RAW  = "raw_green_all"
 YELLOW_CLEAN = "yellow_clean"
 GREEN_CLEAN  = "green_clean"
 
+# (raw source, clean table) per taxi type
+JOBS = [(YELLOW_RAW, YELLOW_CLEAN), (GREEN_RAW, GREEN_CLEAN)]
+
+# Per-month duplicate-removal bookkeeping (makes the dedup stage resumable)
+DEDUP_PROGRESS = "clean_dedup_progress"
+
+# Per-(taxi_type, pickup month) row count + content hash of the clean tables; updated_at
+# only moves when a month's content changes, so dbt rebuilds just those months
+CLEAN_WATERMARK = "clean_watermark"
+
+# STORAGE_MODE=parquet: clean/dedup work in a scratch database next to DB_PATH, the result is
+# written to the lake and main.yellow_clean / main.green_clean become views over it
+SCRATCH_DB    = DB_PATH + ".scratch"
+SCRATCH_ALIAS = "clean_scratch"
+MAIN_DB       = os.path.splitext(os.path.basename(DB_PATH))[0]   # DuckDB's catalog name for DB_PATH
+
+# Clean yellow and green at the same time, each on its own cursor (CLEAN_PARALLEL=1)
+CLEAN_PARALLEL = os.environ.get("CLEAN_PARALLEL", "0") == "1"
+
+# Stages to run, in order; e.g. CLEAN_STAGES=dedup,verify resumes an interrupted dedup
+CLEAN_STAGES = [s.strip() for s in os.environ.get("CLEAN_STAGES", "clean,dedup,verify,compact").split(",") if s.strip()]
+
 
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
     filename="clean.log"
 )
 logger = logging.getLogger(__name__)
@@ -42,19 +71,8 @@ def _connect() -> duckdb.DuckDBPyConnection:
     con = duckdb.connect(database=DB_PATH, read_only=False)
     logger.info("DuckDB connection established")
 
-    # Tuning: reduce temp-pressure and allow larger spill
-    logger.info(
-        "Applying performance pragmas: "
-        f"threads={THREADS}, memory_limit={MEMORY_LIMIT}, "
-        f"max_temp_directory_size={MAX_TEMP_DIR_SIZE}, temp_directory={DUCKDB_TEMP_DIR or '(default)'}"
-    )
-    con.execute(f"SET threads={THREADS};")
+    # Tuning: reduce temp-pressure (resources are set by _preflight)
     con.execute("SET preserve_insertion_order=false;")
-    con.execute(f"PRAGMA memory_limit='{MEMORY_LIMIT}';")
-    con.execute(f"PRAGMA max_temp_directory_size='{MAX_TEMP_DIR_SIZE}';")
-    if DUCKDB_TEMP_DIR:
-        os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
-        con.execute(f"PRAGMA temp_directory='{DUCKDB_TEMP_DIR}';")
     return con
 
 # Defining columns and row counting helper
@@ -65,128 +83,153 @@ def _pickup_drop_cols(table_name: str):
 def _rows(con: duckdb.DuckDBPyConnection, tbl: str) -> int:
     return con.execute(f"SELECT COUNT(*) FROM {tbl}").fetchone()[0]
 
-# 
-# Cleaning using con.execute steps with detailed progress logging
+def _checkpoints(con: duckdb.DuckDBPyConnection, stage: str) -> checkpoints.CheckpointPolicy:
+    # FORCE CHECKPOINT aborts other connections' transactions, so parallel cleaning uses a plain
+    # one and leaves it to the final checkpoint when the other table is mid-write
+    return checkpoints.CheckpointPolicy(con, stage, force=not CLEAN_PARALLEL)
+
+# Cleaning mode: "single_pass" (one aggregate + one CTAS) or "sequential" (one DELETE per rule)
+CLEAN_MODE = os.environ.get("CLEAN_MODE", "single_pass")
+
+# Write clean tables sorted by pickup time so row-group min/max zone maps can skip date ranges
+# (one clean table per taxi type, so this is (taxi_type, pickup_ts) order). CLUSTER_BY_PICKUP=0
+# skips the sort, e.g. when the temp directory cannot hold a full-table sort.
+CLUSTER_BY_PICKUP = os.environ.get("CLUSTER_BY_PICKUP", "1") == "1"
+
+def _cluster_clause(pick: str) -> str:
+    return f"ORDER BY {pick}" if CLUSTER_BY_PICKUP else ""
+
+# Cleaning with a single aggregate pass for the counts and a single CTAS for the table
+
+def _clean_single_pass(
+    con: duckdb.DuckDBPyConnection,
+    src: str,
+    dest: str,
+    pick: str,
+    drop: str,
+    ckpt: checkpoints.CheckpointPolicy,
+    partitioned: bool = False
+):
+    rules = rule_predicates(pick, drop)
+    reject = reject_case(rules)
+
+    # Per-rule removal counts, all from one scan (only the rule columns are read)
+    logger.info(f"Computing per-rule removal counts for {src} in one pass")
+    filters = ",\n".join(
+        f"COUNT(*) FILTER (WHERE reject_rule = {i})" for i in range(1, len(rules) + 1)
+    )
+    counts = con.execute(f"""
+        SELECT COUNT(*), {filters}
+        FROM (SELECT {reject} AS reject_rule FROM {src});
+    """).fetchone()
+    start_cnt, removed = counts[0], counts[1:]
+    logger.info(f"{src}: {start_cnt:,} rows before cleaning")
+    print(f"{dest}: starting rows = {start_cnt:,}")
+
+    # All rules applied at once while copying
+    logger.info(f"Creating {dest} from {src} with all {len(rules)} rules applied (partitioned={partitioned})")
+    if partitioned:
+        _insert_by_month(con, src, dest, pick, reject)
+    else:
+        con.execute(f"""
+            CREATE TABLE {dest} AS
+            SELECT {lake.data_columns()} FROM {src}
+            WHERE ({reject}) = 0
+            {_cluster_clause(pick)};
+        """)
+    ckpt.after(f"creating {dest}")
+
+    for i, ((log_label, print_label, _), n) in enumerate(zip(rules, removed), start=1):
+        logger.info(f"Step {i}/{len(rules)}: {log_label} rows removed: {n:,}")
+        print(f"{dest}: removed {print_label} = {n:,}")
+
+def _insert_by_month(con: duckdb.DuckDBPyConnection, src: str, dest: str, pick: str, reject: str):
+    """
+    Same rows and order as the clustered CTAS, written one pickup month at a time, so the sort
+    only ever holds one month (the planner's "partitioned" strategy). NULL pickups go last, as
+    ORDER BY puts them.
+    In the lake, raw partitions are source-file months and a file can hold pickups from a
+    neighbouring month, so each slice also filters on the (year, month) partitions that hold
+    its pickups: it reads those files only instead of opening every one.
+    """
+    cols = lake.data_columns()
+    con.execute(f"CREATE TABLE {dest} AS SELECT {cols} FROM {src} LIMIT 0;")
+    files = {}
+    if lake.enabled():
+        for month, year, file_month in con.execute(f"""
+            SELECT DISTINCT CAST(date_trunc('month', {pick}) AS DATE), year, month
+            FROM {src}
+            WHERE {pick} IS NOT NULL;
+        """).fetchall():
+            files.setdefault(month, set()).add((year, file_month))
+        months = sorted(files)
+    else:
+        months = [
+            row[0] for row in con.execute(f"""
+                SELECT DISTINCT CAST(date_trunc('month', {pick}) AS DATE) AS month
+                FROM {src}
+                WHERE {pick} IS NOT NULL
+                ORDER BY month;
+            """).fetchall()
+        ]
+    for month in months:
+        prune = f"AND {lake.partition_filter(files[month])}" if lake.enabled() else ""
+        con.execute(f"""
+            INSERT INTO {dest}
+            SELECT {cols} FROM {src}
+            WHERE ({reject}) = 0
+              AND {pick} >= DATE '{month}' AND {pick} < DATE '{month}' + INTERVAL 1 MONTH
+              {prune}
+            ORDER BY {pick};
+        """)
+    con.execute(f"INSERT INTO {dest} SELECT {cols} FROM {src} WHERE ({reject}) = 0 AND {pick} IS NULL;")
+    logger.info(f"{dest}: written in {len(months)} monthly slices")
+
+# Cleaning using one COUNT + DELETE round per rule with detailed progress logging
+
+def _clean_sequential(
+    con: duckdb.DuckDBPyConnection, src: str, dest: str, pick: str, drop: str, ckpt: checkpoints.CheckpointPolicy
+):
+    rules = rule_predicates(pick, drop)
 
-def clean_one(con: duckdb.DuckDBPyConnection, src: str, dest: str):
+    logger.info(f"Creating working copy {dest} from {src}")
+    con.execute(f"CREATE TABLE {dest} AS SELECT {lake.data_columns()} FROM {src} {_cluster_clause(pick)};")
+    start_cnt = _rows(con, dest)
+    logger.info(f"{dest}: working copy created with {start_cnt:,} rows")
+    print(f"{dest}: starting rows = {start_cnt:,}")
+    ckpt.after("working copy")
+
+    for i, (log_label, print_label, pred) in enumerate(rules, start=1):
+        logger.info(f"Step {i}/{len(rules)}: Computing {log_label} rows")
+        n = con.execute(f"SELECT COUNT(*) FROM {dest} WHERE {pred};").fetchone()[0]
+        logger.info(f"Step {i}/{len(rules)}: {log_label} rows to remove: {n:,}")
+        con.execute(f"DELETE FROM {dest} WHERE {pred};")
+        rem_cnt = _rows(con, dest)
+        logger.info(f"Step {i}/{len(rules)} complete: {dest} now has {rem_cnt:,} rows")
+        print(f"{dest}: removed {print_label} = {n:,}")
+        ckpt.after(f"step {i}")
+
+def clean_one(con: duckdb.DuckDBPyConnection, src: str, dest: str, partitioned: bool = False):
     pick, drop = _pickup_drop_cols(src)
 
-    logger.info(f"BEGIN cleaning for source={src}, dest={dest}")
+    logger.info(f"BEGIN cleaning for source={src}, dest={dest} (mode={CLEAN_MODE}, clustered={CLUSTER_BY_PICKUP})")
     print(f"{dest}: begin cleaning from {src}")
 
     # Starting from raw 
     logger.info(f"Dropping existing table {dest} if it exists")
     con.execute(f"DROP TABLE IF EXISTS {dest};")
 
-    logger.info(f"Creating working copy {dest} from {src}")
-    con.execute(f"CREATE TABLE {dest} AS SELECT * FROM {src};")
-    start_cnt = _rows(con, dest)
-    logger.info(f"{dest}: working copy created with {start_cnt:,} rows")
-    print(f"{dest}: starting rows = {start_cnt:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after working copy")
-
-    # Removing rows with years outside [2015, 2024] on BOTH pickup & dropoff
-    logger.info("Step 1/6: Computing out-of-range year rows")
-    bad_years = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE NOT (
-          EXTRACT(YEAR FROM {pick}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-          AND EXTRACT(YEAR FROM {drop}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-        );
-    """).fetchone()[0]
-    logger.info(f"Step 1/6: Out-of-range year rows to remove: {bad_years:,}")
-    con.execute(f"""
-        DELETE FROM {dest}
-        WHERE NOT (
-          EXTRACT(YEAR FROM {pick}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-          AND EXTRACT(YEAR FROM {drop}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-        );
-    """)
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 1/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed out-of-range years = {bad_years:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 1")
-
-    # Removing trips with 0 passengers
-    logger.info("Step 2/6: Computing passenger_count = 0 rows")
-    zero_pax = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE COALESCE(passenger_count, 0) = 0;
-    """).fetchone()[0]
-    logger.info(f"Step 2/6: passenger_count=0 rows to remove: {zero_pax:,}")
-    con.execute(f"""
-        DELETE FROM {dest}
-        WHERE COALESCE(passenger_count, 0) = 0;
-    """)
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 2/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed passenger_count = 0 = {zero_pax:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 2")
-
-    # Removing trips with 0 miles or fewer
-    logger.info("Step 3/6: Computing trip_distance <= 0 rows")
-    dist_le_zero = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE trip_distance <= 0;
-    """).fetchone()[0]
-    logger.info(f"Step 3/6: trip_distance <= 0 rows to remove: {dist_le_zero:,}")
-    con.execute(f"DELETE FROM {dest} WHERE trip_distance <= 0;")
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 3/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed trip_distance <= 0 = {dist_le_zero:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 3")
-
-    # Remove trips with distance > 100 miles
-    logger.info("Step 4/6: Computing trip_distance > 100 rows")
-    dist_gt_100 = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE trip_distance > 100;
-    """).fetchone()[0]
-    logger.info(f"Step 4/6: trip_distance > 100 rows to remove: {dist_gt_100:,}")
-    con.execute(f"DELETE FROM {dest} WHERE trip_distance > 100;")
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 4/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed trip_distance > 100 = {dist_gt_100:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 4")
-
-    # Removing trips with negative duration
-    logger.info("Step 5/6: Computing negative-duration rows")
-    neg_duration = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE {drop} < {pick};
-    """).fetchone()[0]
-    logger.info(f"Step 5/6: negative-duration rows to remove: {neg_duration:,}")
-    con.execute(f"""
-        DELETE FROM {dest}
-        WHERE {drop} < {pick};
-    """)
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 5/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed negative duration = {neg_duration:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 5")
-
-    # Removing trips lasting more than 1 day
-    logger.info("Step 6/6: Computing over-24h rows")
-    over_24h = con.execute(f"""
-        SELECT COUNT(*) FROM {dest}
-        WHERE ({drop} - {pick}) > INTERVAL 1 DAY;
-    """).fetchone()[0]
-    logger.info(f"Step 6/6: over-24h rows to remove: {over_24h:,}")
-    con.execute(f"""
-        DELETE FROM {dest}
-        WHERE ({drop} - {pick}) > INTERVAL 1 DAY;
-    """)
-    rem_cnt = _rows(con, dest)
-    logger.info(f"Step 6/6 complete: {dest} now has {rem_cnt:,} rows")
-    print(f"{dest}: removed duration > 24h = {over_24h:,}")
-    con.execute("PRAGMA force_checkpoint;")
-    logger.info("Checkpoint after step 6")
+    # A rebuilt table has not been deduplicated yet (DEDUP_PROGRESS is created by main)
+    con.execute(f"DELETE FROM {DEDUP_PROGRESS} WHERE table_name = ?;", [dest])
+
+    ckpt = _checkpoints(con, f"clean {dest}")
+    if CLEAN_MODE == "single_pass":
+        _clean_single_pass(con, src, dest, pick, drop, ckpt, partitioned)
+    elif CLEAN_MODE == "sequential":
+        _clean_sequential(con, src, dest, pick, drop, ckpt)
+    else:
+        raise ValueError(f"Unknown CLEAN_MODE={CLEAN_MODE!r} (expected 'single_pass' or 'sequential')")
+    ckpt.end()
 
     # Final count
     final_cnt = _rows(con, dest)
@@ -194,6 +237,143 @@ def clean_one(con: duckdb.DuckDBPyConnection, src: str, dest: str):
     logger.info(f"{dest}: final row count = {final_cnt:,}")
     logger.info(f"END cleaning for dest={dest}")
 
+# Duplicate removal, one pickup month at a time
+
+def _ensure_dedup_progress(con: duckdb.DuckDBPyConnection):
+    # Created once on the main connection before any worker starts: concurrent
+    # CREATE TABLE IF NOT EXISTS from two cursors is a catalog write-write conflict
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DEDUP_PROGRESS} (
+            table_name         VARCHAR,
+            month              DATE,
+            rows_before        BIGINT,
+            duplicates_removed BIGINT,
+            deduped_at         TIMESTAMP,
+            PRIMARY KEY (table_name, month)
+        );
+    """)
+
+def dedup_one(con: duckdb.DuckDBPyConnection, tbl: str):
+    """
+    Remove duplicate trips from tbl, one pickup month at a time.
+    Rows are compared on the pickup/dropoff timestamps and COMMON_KEEP_COLS themselves (a
+    hash alone would delete distinct trips whose hashes collide), and temp space is bounded
+    by the largest month.
+    Each month is deleted and recorded in DEDUP_PROGRESS in one transaction; months already
+    recorded are skipped, so a rerun resumes where a crash left off.
+    Rows with a NULL pickup cannot be assigned to a month and are left as they are.
+    """
+    pick, drop = _pickup_drop_cols(tbl)
+    key_cols = ", ".join(f'"{c}"' for c in [pick, drop] + COMMON_KEEP_COLS)
+
+    logger.info(f"BEGIN duplicate removal for table={tbl}")
+    print(f"\n{tbl}: removing duplicates month by month")
+
+    done = {
+        row[0] for row in con.execute(
+            f"SELECT month FROM {DEDUP_PROGRESS} WHERE table_name = ?;", [tbl]
+        ).fetchall()
+    }
+    months = [
+        row[0] for row in con.execute(f"""
+            SELECT DISTINCT CAST(date_trunc('month', {pick}) AS DATE) AS month
+            FROM {tbl}
+            WHERE {pick} IS NOT NULL
+            ORDER BY month;
+        """).fetchall()
+    ]
+    if done:
+        logger.info(f"{tbl}: {len(done)} of {len(months)} months already deduplicated, resuming")
+
+    ckpt = _checkpoints(con, f"dedup {tbl}")
+    total_removed = 0
+    for month in months:
+        if month in done:
+            continue
+        month_pred = f"{pick} >= DATE '{month}' AND {pick} < DATE '{month}' + INTERVAL 1 MONTH"
+
+        con.execute("BEGIN TRANSACTION;")
+        try:
+            rows_before = con.execute(f"SELECT COUNT(*) FROM {tbl} WHERE {month_pred};").fetchone()[0]
+            removed = con.execute(f"""
+                DELETE FROM {tbl}
+                WHERE rowid IN (
+                    SELECT rowid
+                    FROM (
+                        SELECT rowid,
+                               row_number() OVER (PARTITION BY {key_cols} ORDER BY rowid) AS rn
+                        FROM {tbl}
+                        WHERE {month_pred}
+                    )
+                    WHERE rn > 1
+                );
+            """).fetchone()[0]
+            con.execute(
+                f"INSERT INTO {DEDUP_PROGRESS} VALUES (?, ?, ?, ?, now());",
+                [tbl, month, rows_before, removed],
+            )
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+
+        total_removed += removed
+        line = f"{tbl}: {month:%Y-%m} duplicates removed = {removed:,} (of {rows_before:,})"
+        print(line)
+        logger.info(line)
+        # The deletes are durable with their DEDUP_PROGRESS row; checkpoint when the policy says so
+        ckpt.after(f"{month:%Y-%m}")
+
+    ckpt.end()
+
+    total = con.execute(
+        f"SELECT COALESCE(SUM(duplicates_removed), 0) FROM {DEDUP_PROGRESS} WHERE table_name = ?;", [tbl]
+    ).fetchone()[0]
+    print(f"{tbl}: removed duplicates = {total:,} (this run: {total_removed:,})")
+    logger.info(f"{tbl}: duplicates removed total={total:,}, this run={total_removed:,}")
+    logger.info(f"END duplicate removal for table={tbl}")
+
+# Source-side watermark for the incremental dbt models
+
+def update_watermark(con: duckdb.DuckDBPyConnection):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CLEAN_WATERMARK} (
+            taxi_type    VARCHAR,
+            month        DATE,
+            row_count    BIGINT,
+            content_hash HUGEINT,
+            updated_at   TIMESTAMP,
+            PRIMARY KEY (taxi_type, month)
+        );
+    """)
+    stamp = con.execute("SELECT CAST(now() AS TIMESTAMP);").fetchone()[0]
+    for tbl, taxi_type in ((YELLOW_CLEAN, "YELLOW"), (GREEN_CLEAN, "GREEN")):
+        pick, drop = _pickup_drop_cols(tbl)
+        # Months that vanished from the clean table are kept with row_count 0 so dbt drops them too
+        con.execute(f"""
+            INSERT INTO {CLEAN_WATERMARK}
+            WITH cur AS (
+                SELECT CAST(date_trunc('month', {pick}) AS DATE) AS month,
+                       COUNT(*) AS row_count,
+                       SUM(hash({pick}, {drop}, trip_distance, passenger_count)) AS content_hash
+                FROM {tbl}
+                WHERE {pick} IS NOT NULL
+                GROUP BY 1
+            )
+            SELECT ?, COALESCE(cur.month, w.month), COALESCE(cur.row_count, 0), COALESCE(cur.content_hash, 0), ?
+            FROM cur
+            FULL JOIN (SELECT month FROM {CLEAN_WATERMARK} WHERE taxi_type = ?) w USING (month)
+            ON CONFLICT (taxi_type, month) DO UPDATE
+                SET row_count = excluded.row_count, content_hash = excluded.content_hash, updated_at = excluded.updated_at
+                WHERE {CLEAN_WATERMARK}.row_count    IS DISTINCT FROM excluded.row_count
+                   OR {CLEAN_WATERMARK}.content_hash IS DISTINCT FROM excluded.content_hash;
+        """, [taxi_type, stamp, taxi_type])
+        changed = con.execute(
+            f"SELECT COUNT(*) FROM {CLEAN_WATERMARK} WHERE taxi_type = ? AND updated_at = ?;", [taxi_type, stamp]
+        ).fetchone()[0]
+        print(f"{tbl}: months changed since last watermark = {changed}")
+        logger.info(f"{CLEAN_WATERMARK}: {changed} month(s) of {tbl} changed")
+
 # Verification (full-table checks for all rules except duplicates)
 
 def verify_one(con: duckdb.DuckDBPyConnection, tbl: str, is_yellow: bool):
@@ -204,24 +384,18 @@ def verify_one(con: duckdb.DuckDBPyConnection, tbl: str, is_yellow: bool):
     print(f"\nVerification checklist for {tbl}:")
     logger.info(f"Verification checklist for {tbl}:")
 
-    checks = [
-        ("passenger_count = 0", f"SELECT COUNT(*) FROM {tbl} WHERE COALESCE(passenger_count, 0) = 0"),
-        ("trip_distance <= 0", f"SELECT COUNT(*) FROM {tbl} WHERE trip_distance <= 0"),
-        ("trip_distance > 100", f"SELECT COUNT(*) FROM {tbl} WHERE trip_distance > 100"),
-        ("negative duration", f"SELECT COUNT(*) FROM {tbl} WHERE {drop} < {pick}"),
-        ("duration > 24h", f"SELECT COUNT(*) FROM {tbl} WHERE ({drop} - {pick}) > INTERVAL 1 DAY"),
-        (f"year outside [{YEAR_MIN},{YEAR_MAX}]", f"""
-            SELECT COUNT(*) FROM {tbl}
-            WHERE NOT (
-              EXTRACT(YEAR FROM {pick}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-              AND EXTRACT(YEAR FROM {drop}) BETWEEN {YEAR_MIN} AND {YEAR_MAX}
-            )
-        """),
-    ]
+    # Same predicates as the cleaning rules, all counted in one scan; the year check keeps
+    # its report label and its place at the end of the checklist
+    rules = rule_predicates(pick, drop)
+    year_rule, other_rules = rules[0], rules[1:]
+    checks = [(label, pred) for _, label, pred in other_rules]
+    checks.append((f"year outside [{YEAR_MIN},{YEAR_MAX}]", year_rule[2]))
+
+    filters = ",\n".join(f"COUNT(*) FILTER (WHERE {pred})" for _, pred in checks)
+    counts = con.execute(f"SELECT {filters} FROM {tbl};").fetchone()
 
     all_ok = True
-    for label, sql in checks:
-        count = con.execute(sql).fetchone()[0]
+    for (label, _), count in zip(checks, counts):
         line = f"  {label}: {count}"
         print(line)
         logger.info(line)
@@ -233,6 +407,190 @@ def verify_one(con: duckdb.DuckDBPyConnection, tbl: str, is_yellow: bool):
     logger.info(status)
     logger.info(f"END verification for table={tbl}")
 
+# Preflight: size the clean/dedup working sets and let planner.py pick resources and strategy
+
+def _table_exists(con: duckdb.DuckDBPyConnection, name: str) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?;", [name]
+    ).fetchone()[0] > 0
+
+def _size_estimate(con: duckdb.DuckDBPyConnection, tbl: str, raw: bool):
+    """
+    (rows, largest month's rows) of a raw view or clean table from bookkeeping, without
+    scanning it: load_manifest row counts for raw months, the catalog estimate and
+    clean_watermark for clean tables. Without bookkeeping the whole table counts as one month.
+    """
+    if raw:
+        book, taxi_type = LOAD_MANIFEST, ("yellow" if "yellow" in tbl else "green")
+        where = "status = 'loaded'"
+    else:
+        book, taxi_type = CLEAN_WATERMARK, ("YELLOW" if "yellow" in tbl else "GREEN")
+        where = "row_count > 0"
+    total = largest = None
+    if _table_exists(con, book):
+        total, largest = con.execute(
+            f"SELECT SUM(row_count), MAX(row_count) FROM {book} WHERE taxi_type = ? AND {where};", [taxi_type]
+        ).fetchone()
+    # A clean table being resumed may have moved on since its last watermark
+    rows = planner.estimated_rows(con, tbl) if not raw or total is None else None
+    rows = rows if rows is not None else (total or 0)
+    return rows, min(largest or rows, rows)
+
+def _preflight(con: duckdb.DuckDBPyConnection) -> dict:
+    """
+    Working set per table: the clustered CTAS sorts the whole table ("single_pass"), or one
+    pickup month at a time ("partitioned"); dedup holds rowid + key columns + row number for its
+    largest month. Parallel cleaning needs both tables' at once. The clean copy is at most
+    the raw data again on disk. Row counts come from bookkeeping (_size_estimate), so the
+    preflight does not scan the data.
+    """
+    cleaning = "clean" in CLEAN_STAGES
+    whole, monthly, table_rows = [], [], {}
+    for src, dest in JOBS:
+        tbl = src if cleaning else dest
+        rows, month_rows = _size_estimate(con, tbl, raw=cleaning)
+        nbytes = rows * planner.row_bytes(con, tbl)
+        table_rows[tbl] = rows
+        logger.info(f"Preflight estimate for {tbl}: {rows:,} rows, largest month {month_rows:,}")
+        dedup = month_rows * (nbytes // rows + 16) if "dedup" in CLEAN_STAGES and rows else 0
+        sort_all = nbytes if cleaning and CLUSTER_BY_PICKUP else 0
+        sort_month = month_rows * (nbytes // rows) if cleaning and CLUSTER_BY_PICKUP and rows else 0
+        whole.append(max(sort_all, dedup))
+        monthly.append(max(sort_month, dedup))
+    combine = sum if CLEAN_PARALLEL else max
+    candidates = [(CLEAN_MODE, combine(whole))]
+    if CLEAN_MODE == "single_pass" and cleaning and CLUSTER_BY_PICKUP:
+        candidates.append(("partitioned", combine(monthly)))
+
+    write_bytes = 0
+    if cleaning:
+        if lake.enabled():
+            # Scratch tables next to DB_PATH (the Parquet export goes to LAKE_DIR)
+            write_bytes = planner.dir_bytes(os.path.join(lake.LAKE_DIR, "raw"))
+        else:
+            write_bytes = planner.schema_stored_bytes(con, RAW_PARTS_SCHEMA)
+    p = planner.plan("clean", candidates, write_bytes, db_path=DB_PATH)
+    planner.apply(con, p)
+    p["table_rows"] = table_rows
+    return p
+
+# Parallel cleaning: yellow and green on separate cursors at the same time
+
+def _split_budget(row_counts: dict, threads: int, mem: int) -> dict:
+    """
+    The planned threads and memory_limit split in proportion to each table's rows (at least 1 thread each).
+    DuckDB only has database-wide threads/memory_limit settings (they cannot be set per
+    connection), so these shares are logged as each table's budget while both statements
+    run over the shared pool sized to the totals.
+    """
+    total_rows = sum(row_counts.values()) or 1
+    return {
+        tbl: (max(1, round(threads * n / total_rows)), int(mem * n / total_rows))
+        for tbl, n in row_counts.items()
+    }
+
+def _clean_table(cur: duckdb.DuckDBPyConnection, src: str, dest: str, partitioned: bool):
+    # One table's clean + dedup stages on its own cursor; the thread name tags its log lines
+    threading.current_thread().name = f"clean-{dest}"
+    try:
+        if "clean" in CLEAN_STAGES:
+            clean_one(cur, src, dest, partitioned)
+        if "dedup" in CLEAN_STAGES:
+            dedup_one(cur, dest)
+    finally:
+        cur.close()
+
+def _clean_parallel(con: duckdb.DuckDBPyConnection, plan: dict):
+    budgets = _split_budget(plan["table_rows"], plan["threads"], plan["memory_limit"])
+    for tbl, (threads, mem) in budgets.items():
+        logger.info(
+            f"Budget for {tbl}: ~{threads} of {plan['threads']} threads, "
+            f"~{mem / 2**30:.1f} of {plan['memory_limit'] / 2**30:.1f} GiB"
+        )
+
+    print("\nCleaning YELLOW and GREEN in parallel")
+    logger.info("Starting parallel cleaning for YELLOW and GREEN")
+    cursors = [con.cursor() for _ in JOBS]
+    if lake.enabled():
+        for cur in cursors:
+            _use_scratch(cur)
+    partitioned = plan["strategy"] == "partitioned"
+    with ThreadPoolExecutor(max_workers=len(JOBS)) as pool:
+        futures = [
+            pool.submit(_clean_table, cur, src, dest, partitioned) for cur, (src, dest) in zip(cursors, JOBS)
+        ]
+        for fut in futures:
+            fut.result()
+    con.execute("PRAGMA force_checkpoint;")
+    logger.info("Checkpoint after parallel cleaning")
+
+# Parquet lake mode: scratch database for the table-rewriting stages, then export
+
+def _use_scratch(con: duckdb.DuckDBPyConnection):
+    # New tables go to the scratch database; raw views are still found in the main one
+    con.execute(f"USE {SCRATCH_ALIAS};")
+    con.execute(f"SET search_path = '{SCRATCH_ALIAS}.main,{MAIN_DB}.main';")
+
+def _attach_scratch(con: duckdb.DuckDBPyConnection):
+    # Kept across runs until exported, so an interrupted dedup can resume from it
+    con.execute(f"ATTACH '{SCRATCH_DB}' AS {SCRATCH_ALIAS};")
+    if "clean" in CLEAN_STAGES:
+        # Rebuilding: the views over the previous export would shadow the scratch tables
+        for tbl in (YELLOW_CLEAN, GREEN_CLEAN):
+            con.execute(f"DROP VIEW IF EXISTS {MAIN_DB}.main.{tbl};")
+    _use_scratch(con)
+    logger.info(f"Working in scratch database {SCRATCH_DB}")
+
+def _export_to_lake(con: duckdb.DuckDBPyConnection):
+    exported = []
+    for tbl in (YELLOW_CLEAN, GREEN_CLEAN):
+        exists = con.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = ? AND table_name = ?;",
+            [SCRATCH_ALIAS, tbl],
+        ).fetchone()[0]
+        if not exists:
+            continue
+        pick, _ = _pickup_drop_cols(tbl)
+        taxi_type = "YELLOW" if "yellow" in tbl else "GREEN"
+        n = lake.write_layer(con, "clean", taxi_type, f"SELECT * FROM {SCRATCH_ALIAS}.main.{tbl}", pick)
+        print(f"{tbl}: wrote {n:,} rows to {lake.layer_dir('clean', taxi_type)}")
+        exported.append((tbl, taxi_type))
+
+    con.execute(f"USE {MAIN_DB};")
+    con.execute("RESET search_path;")
+    for tbl, taxi_type in exported:
+        lake.create_view(con, tbl, lake.layer_glob("clean", taxi_type))
+        logger.info(f"{MAIN_DB}.{tbl} is now a view over {lake.layer_dir('clean', taxi_type)}")
+
+    con.execute(f"DETACH {SCRATCH_ALIAS};")
+    for path in (SCRATCH_DB, SCRATCH_DB + ".wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info(f"Removed scratch database {SCRATCH_DB}")
+
+# Dropping raw data (views over per-month partitions, or single tables from older loads)
+
+def _drop_raw(con: duckdb.DuckDBPyConnection):
+    for tbl in (YELLOW_RAW, GREEN_RAW):
+        kind = con.execute(
+            "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?;",
+            [tbl],
+        ).fetchone()
+        if kind is None:
+            continue
+        con.execute(f"DROP {'VIEW' if kind[0] == 'VIEW' else 'TABLE'} {tbl};")
+    con.execute(f"DROP SCHEMA IF EXISTS {RAW_PARTS_SCHEMA} CASCADE;")
+    if lake.enabled():
+        lake.remove_layer("raw")
+
+    # The months are gone, so the next load.py run must fetch them again
+    has_manifest = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?;",
+        [LOAD_MANIFEST],
+    ).fetchone()[0]
+    if has_manifest:
+        con.execute(f"UPDATE {LOAD_MANIFEST} SET status = 'purged' WHERE status = 'loaded';")
+
 # Main
 
 def main():
@@ -241,13 +599,39 @@ def main():
         con = _connect()
         logger.info(f"Connected to DuckDB at {DB_PATH}")
 
-        print("\nCleaning YELLOW")
-        logger.info("Starting cleaning for YELLOW")
-        clean_one(con, YELLOW_RAW, YELLOW_CLEAN)
+        logger.info(f"Clean stages: {CLEAN_STAGES}")
+
+        writes = "clean" in CLEAN_STAGES or "dedup" in CLEAN_STAGES
+        if lake.enabled() and writes:
+            _attach_scratch(con)
+        if writes:
+            _ensure_dedup_progress(con)
+
+        # Refuses to start when the planned working set or output cannot fit
+        plan = _preflight(con)
+        partitioned = plan["strategy"] == "partitioned"
+
+        if CLEAN_PARALLEL:
+            _clean_parallel(con, plan)
+        else:
+            if "clean" in CLEAN_STAGES:
+                print("\nCleaning YELLOW")
+                logger.info("Starting cleaning for YELLOW")
+                clean_one(con, YELLOW_RAW, YELLOW_CLEAN, partitioned)
+
+                print("\nCleaning GREEN")
+                logger.info("Starting cleaning for GREEN")
+                clean_one(con, GREEN_RAW, GREEN_CLEAN, partitioned)
+
+            if "dedup" in CLEAN_STAGES:
+                dedup_one(con, YELLOW_CLEAN)
+                dedup_one(con, GREEN_CLEAN)
+
+        if lake.enabled() and writes:
+            _export_to_lake(con)
 
-        print("\nCleaning GREEN")
-        logger.info("Starting cleaning for GREEN")
-        clean_one(con, GREEN_RAW, GREEN_CLEAN)
+        # Record which months changed (read by dbt's incremental fct_trips_enriched)
+        update_watermark(con)
 
         # Summary (post-clean counts)
         y_cnt = _rows(con, YELLOW_CLEAN)
@@ -260,23 +644,31 @@ def main():
         logger.info(summary)
 
         # Verification checklists (screen + log)
-        verify_one(con, YELLOW_CLEAN, is_yellow=True)
-        verify_one(con, GREEN_CLEAN,  is_yellow=False)
+        if "verify" in CLEAN_STAGES:
+            verify_one(con, YELLOW_CLEAN, is_yellow=True)
+            verify_one(con, GREEN_CLEAN,  is_yellow=False)
 
         # Replace raw with clean and compact the file so it shrinks
-        print("\nDropping raw tables to keep only cleaned data…")
-        logger.info("Dropping raw tables raw_yellow_all, raw_green_all")
-        con.execute("DROP TABLE IF EXISTS raw_yellow_all;")
-        con.execute("DROP TABLE IF EXISTS raw_green_all;")
-        con.execute("PRAGMA force_checkpoint;")
-        logger.info("Raw tables dropped; running VACUUM to compact file")
-
-        print("Running VACUUM to compact emissions.duckdb …")
-        con.execute("VACUUM;") 
-        logger.info("VACUUM complete")
-
-        print("Cleanup complete. Database now contains only yellow_clean and green_clean (plus any lookups).")
-        logger.info("Cleaning stage completed, raw tables removed, database compacted")
+        if "compact" in CLEAN_STAGES:
+            print("\nDropping raw tables to keep only cleaned data…")
+            logger.info("Dropping raw tables raw_yellow_all, raw_green_all")
+            _drop_raw(con)
+            con.execute("PRAGMA force_checkpoint;")
+            if lake.enabled():
+                # Raw data never entered the DuckDB file, so there is nothing to compact
+                logger.info(f"Raw views and {lake.LAKE_DIR}/raw removed")
+            else:
+                logger.info("Raw tables dropped; copying live tables into a fresh file")
+
+                # compact.py needs the file to itself
+                con.close()
+                con = None
+                print(f"Compacting {DB_PATH} …")
+                compact.compact(DB_PATH, dry_run=False)
+                logger.info("Compaction complete")
+
+            print("Cleanup complete. Database now contains only yellow_clean and green_clean (plus any lookups).")
+            logger.info("Cleaning stage completed, raw tables removed, database compacted")
     except Exception as e:
         logger.exception(f"Cleaning error: {e}")
         raise
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Definitions shared by the pipeline stages (load.py, clean.py).
+# No logging setup or connections here, so importing it has no side effects.
+
+# Raw trips: one table per (taxi type, month) in this schema, recorded in the load manifest;
+# main.raw_yellow_all / main.raw_green_all are UNION ALL views over the loaded months
+RAW_PARTS_SCHEMA = "raw_parts"
+LOAD_MANIFEST    = "load_manifest"
+
+# Columns to keep (trimmed to reduce DB size and speed up queries)
+COMMON_KEEP_COLS = [
+    "VendorID",
+    "passenger_count",
+    "trip_distance",
+    "RatecodeID",
+    "store_and_fwd_flag",
+    "PULocationID", "DOLocationID",
+    "payment_type",
+    "fare_amount", "extra", "mta_tax",
+    "tip_amount", "tolls_amount",
+    "improvement_surcharge",
+    "total_amount",
+    "congestion_surcharge",
+    "airport_fee",
+]
+
+# Valid trip years (pickup and dropoff)
+YEAR_MIN, YEAR_MAX = 2015, 2024
+
+# Cleaning rules, in the order they are applied: (log label, print label, predicate).
+# A row is attributed to the FIRST rule whose predicate is TRUE; a NULL predicate never
+# removes a row, exactly like one DELETE per rule in this order.
+# Used by clean.py (cleaning + verification) and by load.py's filter-on-ingest mode.
+CLEAN_RULES = [
+    ("out-of-range year", "out-of-range years", """
+        NOT (
+          EXTRACT(YEAR FROM {pick}) BETWEEN {ymin} AND {ymax}
+          AND EXTRACT(YEAR FROM {drop}) BETWEEN {ymin} AND {ymax}
+        )"""),
+    ("passenger_count=0", "passenger_count = 0", "COALESCE(passenger_count, 0) = 0"),
+    ("trip_distance <= 0", "trip_distance <= 0", "trip_distance <= 0"),
+    ("trip_distance > 100", "trip_distance > 100", "trip_distance > 100"),
+    ("negative-duration", "negative duration", "{drop} < {pick}"),
+    ("over-24h", "duration > 24h", "({drop} - {pick}) > INTERVAL 1 DAY"),
+]
+
+def rule_predicates(pick: str, drop: str):
+    return [
+        (log_label, print_label, pred.format(pick=pick, drop=drop, ymin=YEAR_MIN, ymax=YEAR_MAX))
+        for log_label, print_label, pred in CLEAN_RULES
+    ]
+
+def reject_case(rules) -> str:
+    """
+    CASE expression returning the 1-based index of the first rule that rejects the row
+    (0 = keep). CASE skips NULL conditions, so attribution matches sequential DELETEs.
+    """
+    whens = "\n".join(f"WHEN {pred} THEN {i}" for i, (_, _, pred) in enumerate(rules, start=1))
+    return f"CASE\n{whens}\nELSE 0 END"
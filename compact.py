@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+# Compaction by copying into a fresh file.
+#
+# VACUUM does not reliably hand freed blocks back to the OS, so after raw data is dropped
+# emissions.duckdb stays at its peak size. Instead the live tables (whatever is left in the
+# database: clean tables, vehicle_emissions, dbt marts, bookkeeping) are copied into a new
+# file ATTACHed next to it, in clustered order, together with the views and macros; the
+# new file then replaces the old one with an atomic rename.
+#
+#   python compact.py                    # compact DB_PATH
+#   COMPACT_DRY_RUN=1 python compact.py  # only report the estimate and the free-space check
+
+import logging
+import os
+import shutil
+import time
+
+import duckdb
+
+import planner
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get("DB_PATH", "emissions.duckdb")
+COMPACT_DRY_RUN = os.environ.get("COMPACT_DRY_RUN", "0") == "1"
+
+# Free space required next to DB_PATH, as a multiple of the estimated compacted size
+COMPACT_SPACE_MARGIN = float(os.environ.get("COMPACT_SPACE_MARGIN", "1.2"))
+
+CLUSTER_BY_PICKUP = os.environ.get("CLUSTER_BY_PICKUP", "1") == "1"
+
+NEW_ALIAS = "compact_new"
+
+# Sort keys, in priority order, for whichever of them a table has; this is the order
+# clean.py and the dbt marts already write (taxi type, then pickup time / month)
+CLUSTER_KEYS = ("taxi_type", "month", "pickup_ts", "tpep_pickup_datetime", "lpep_pickup_datetime")
+
+def _live_tables(con: duckdb.DuckDBPyConnection, catalog: str):
+    """[(schema, table, columns)] of every base table in the database."""
+    rows = con.execute("""
+        SELECT t.schema_name, t.table_name, list(c.column_name ORDER BY c.column_index)
+        FROM duckdb_tables() t
+        JOIN duckdb_columns() c USING (database_name, schema_name, table_name)
+        WHERE t.database_name = ? AND NOT t.internal AND NOT t.temporary
+        GROUP BY ALL
+        ORDER BY 1, 2
+    """, [catalog]).fetchall()
+    return rows
+
+def _order_by(columns) -> str:
+    keys = [k for k in CLUSTER_KEYS if k in columns]
+    return f"ORDER BY {', '.join(keys)}" if keys and CLUSTER_BY_PICKUP else ""
+
+def estimate(con: duckdb.DuckDBPyConnection) -> dict:
+    """Current file size, estimated compacted size and per-table detail, without writing anything."""
+    catalog, block_size = con.execute(
+        "SELECT database_name, block_size FROM pragma_database_size() WHERE database_name = current_database()"
+    ).fetchone()
+    tables = []
+    for schema, table, columns in _live_tables(con, catalog):
+        rows = con.execute(f'SELECT COUNT(*) FROM "{catalog}"."{schema}"."{table}"').fetchone()[0]
+        tables.append({
+            "name": f"{schema}.{table}",
+            "rows": rows,
+            "bytes": planner.stored_bytes(con, f"{catalog}.{schema}.{table}"),
+            "order_by": _order_by(columns),
+        })
+    # Header blocks plus catalog metadata: a few blocks regardless of the data
+    new_bytes = sum(t["bytes"] for t in tables) + 4 * block_size
+    return {"catalog": catalog, "tables": tables, "new_bytes": new_bytes}
+
+def _report(path: str, est: dict, free: int, needed: int) -> None:
+    size = os.path.getsize(path)
+    print(f"\nCompaction estimate for {path}:")
+    for t in est["tables"]:
+        print(f"  {t['name']:40} {t['rows']:>14,} rows {t['bytes'] / 2**20:>10.1f} MiB  {t['order_by'] or '(storage order)'}")
+    print(f"  current file {size / 2**20:,.1f} MiB -> estimated {est['new_bytes'] / 2**20:,.1f} MiB "
+          f"(~{max(size - est['new_bytes'], 0) / 2**20:,.1f} MiB reclaimable)")
+    print(f"  free space {free / 2**30:,.1f} GiB, needed {needed / 2**30:,.2f} GiB")
+    logger.info(
+        f"Compaction estimate for {path}: {size:,} bytes -> ~{est['new_bytes']:,} bytes; "
+        f"free={free:,} needed={needed:,}"
+    )
+
+def compact(path: str = DB_PATH, dry_run: bool = COMPACT_DRY_RUN) -> dict:
+    """
+    Copy the live contents of path into path + '.compact' and swap it in.
+    The database must not be open elsewhere. Returns sizes (bytes) and elapsed seconds.
+    """
+    new_path = path + ".compact"
+    for stale in (new_path, new_path + ".wal"):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    con = duckdb.connect(database=path, read_only=dry_run)
+    try:
+        try:
+            if not dry_run:
+                # Fold the WAL in so the storage stats (and the old file) are complete
+                con.execute("PRAGMA force_checkpoint;")
+            est = estimate(con)
+            free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+            needed = int(est["new_bytes"] * COMPACT_SPACE_MARGIN)
+            _report(path, est, free, needed)
+            if dry_run:
+                return {"before": os.path.getsize(path), "estimate": est["new_bytes"], "free": free}
+            if free < needed:
+                raise RuntimeError(
+                    f"Not enough free space to compact {path}: {free:,} bytes free, {needed:,} needed "
+                    f"(COMPACT_SPACE_MARGIN={COMPACT_SPACE_MARGIN})"
+                )
+
+            # The clustered copy sorts one table at a time; a large sort spills to temp
+            largest = max([t["rows"] * planner.row_bytes(con, f'"{est["catalog"]}".{t["name"]}')
+                           for t in est["tables"] if t["order_by"]] or [0])
+            planner.apply(con, planner.plan("compact", [("clustered copy", largest)], needed, db_path=path))
+
+            before = os.path.getsize(path)
+            t0 = time.perf_counter()
+            catalog = est["catalog"]
+            con.execute(f"ATTACH '{new_path}' AS {NEW_ALIAS};")
+            # Schemas, tables, views, macros and types; the data follows table by table
+            con.execute(f'COPY FROM DATABASE "{catalog}" TO {NEW_ALIAS} (SCHEMA);')
+            for t in est["tables"]:
+                schema, table = t["name"].split(".", 1)
+                t1 = time.perf_counter()
+                con.execute(f"""
+                    INSERT INTO {NEW_ALIAS}."{schema}"."{table}"
+                    SELECT * FROM "{catalog}"."{schema}"."{table}" {t['order_by']};
+                """)
+                logger.info(f"Copied {t['name']} ({t['rows']:,} rows) in {time.perf_counter() - t1:.1f}s")
+            con.execute(f"DETACH {NEW_ALIAS};")
+        finally:
+            # Also on the dry-run return, so the caller can reopen the file read-write
+            con.close()
+    except Exception:
+        for leftover in (new_path, new_path + ".wal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    if os.path.exists(path + ".wal"):
+        raise RuntimeError(f"{path}.wal still present after close; keeping the uncompacted file")
+    os.replace(new_path, path)
+    elapsed = time.perf_counter() - t0
+    after = os.path.getsize(path)
+
+    msg = (
+        f"Compacted {path}: {before / 2**20:,.1f} MiB -> {after / 2**20:,.1f} MiB "
+        f"({(1 - after / before) if before else 0:.0%} smaller) in {elapsed:.1f}s"
+    )
+    print(msg)
+    logger.info(msg)
+    return {"before": before, "after": after, "seconds": elapsed}
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        filename="compact.log"
+    )
+    try:
+        compact()
+    except Exception as e:
+        logger.exception(f"Compaction error: {e}")
+        raise
@@ -0,0 +1,30 @@
+-- Monthly CO2 rollup at (taxi_type, month, hour_of_day, day_of_week, week_of_year) grain.
+-- Every figure in analysis.py is a sum/count over these cells, so the report reads this
+-- small table instead of aggregating the trip-level view on each run.
+
+{{ config(materialized='table') }}
+
+select
+  taxi_type,
+  date_trunc('month', pickup_ts)                           as month,
+  hour_of_day,
+  day_of_week,
+  week_of_year,
+
+  count(*)                                                 as trip_count,
+  -- trips with a CO2 figure (trip_co2_kgs is NULL where trip_distance is); averages divide by this
+  count(trip_co2_kgs)                                      as co2_trip_count,
+  sum(trip_co2_kgs)                                        as co2_kgs_sum,
+  sum(trip_distance)                                       as trip_distance_sum,
+  sum(trip_duration_minutes)                               as trip_duration_minutes_sum,
+
+  -- largest trip in the cell; earliest pickup wins ties, as in analysis.py. A (NULL, ts) key
+  -- is not NULL itself and would outrank real values, so NULL-CO2 trips are filtered out
+  max(trip_co2_kgs)                                        as max_trip_co2_kgs,
+  arg_max(pickup_ts,     (trip_co2_kgs, -epoch_us(pickup_ts))) filter (where trip_co2_kgs is not null) as max_co2_pickup_ts,
+  arg_max(trip_distance, (trip_co2_kgs, -epoch_us(pickup_ts))) filter (where trip_co2_kgs is not null) as max_co2_trip_distance,
+  arg_max(avg_mph,       (trip_co2_kgs, -epoch_us(pickup_ts))) filter (where trip_co2_kgs is not null) as max_co2_avg_mph
+
+from {{ ref('fct_trips_enriched') }}
+group by all
+order by taxi_type, month
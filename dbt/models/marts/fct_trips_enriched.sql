@@ -1,14 +1,103 @@
 -- models/marts/fct_trips_enriched.sql
 -- Inserted columns are all in this table
+-- Incremental by pickup month: only months whose clean_watermark (written by clean.py)
+-- moved past the one stored with the month are recomputed, via delete+insert on pickup_month;
+-- months that no longer have any clean rows are deleted by the pre-hook.
+-- Run with --full-refresh after changing vehicle_emissions or this model's logic.
+--
+-- With STORAGE_MODE=parquet the model is instead written in full to
+-- $LAKE_DIR/enriched/taxi_type=/year=/month= and left as a view over those files, so
+-- emissions.duckdb holds no trip rows. LAKE_DIR must be set to an absolute path (the run
+-- stops otherwise).
 
-{{ config(materialized='view') }}
+{% set lake = env_var('STORAGE_MODE', 'duckdb') == 'parquet' %}
+{#- dbt runs from dbt/, so a relative or defaulted LAKE_DIR would not be the directory
+    lake.py resolves from the repo root -#}
+{% if lake and not env_var('LAKE_DIR', '').startswith('/') %}
+  {{ exceptions.raise_compiler_error(
+      "STORAGE_MODE=parquet needs LAKE_DIR set to the absolute path load.py and clean.py used, got '"
+      ~ env_var('LAKE_DIR', '') ~ "'") }}
+{% endif %}
+{% set lake_dir = env_var('LAKE_DIR', '').rstrip('/') ~ '/enriched' if lake else '' %}
 
+{#- Earliest changed month, looked up before the model runs so the scan below gets a literal
+    pickup_ts range that zone maps can prune on (a join on date_trunc reads every row group) -#}
+{% set since = none %}
+{% if execute and is_incremental() %}
+  {% set since = run_query(
+      "select min(w.month)
+       from (select month, max(updated_at) as updated_at
+             from " ~ source('clean', 'clean_watermark') ~ " group by 1) w
+       left join (select pickup_month, max(source_updated_at) as updated_at
+                  from " ~ this ~ " group by 1) b on b.pickup_month = w.month
+       where b.updated_at is null or w.updated_at > b.updated_at"
+  ).columns[0].values()[0] %}
+{% endif %}
 
-with base as (
-  select *
-  from {{ ref('fct_trips') }}
-  where pickup_ts >= timestamp '2015-01-01'
-    and pickup_ts <  timestamp '2025-01-01'
+{{ config(
+    materialized='view' if lake else 'incremental',
+    incremental_strategy='delete+insert',
+    unique_key='pickup_month',
+    pre_hook="{% if is_incremental() %}
+      delete from {{ this }} where pickup_month in (
+        select month from {{ source('clean', 'clean_watermark') }} group by 1 having sum(row_count) = 0
+      )
+    {% endif %}",
+    post_hook=[
+      "copy (
+         select *, year(pickup_ts) as year, strftime(pickup_ts, '%m') as month from {{ this }}
+       ) to '" ~ lake_dir ~ "' (
+         format parquet,
+         compression " ~ env_var('LAKE_COMPRESSION', 'zstd') ~ ",
+         row_group_size " ~ env_var('LAKE_ROW_GROUP_SIZE', '500000') ~ ",
+         partition_by (taxi_type, year, month),
+         filename_pattern 'data_{i}',
+         overwrite true
+       )",
+      "create or replace view {{ this }} as
+       select * exclude (year, month) replace (taxi_type::enum('YELLOW', 'GREEN') as taxi_type)
+       from read_parquet('" ~ lake_dir ~ "/*/*/*/*.parquet', hive_partitioning = true)"
+    ] if lake else []
+) }}
+
+
+with watermark as (
+  select month as pickup_month, max(updated_at) as source_updated_at
+  from {{ source('clean', 'clean_watermark') }}
+  group by 1
+),
+{% if is_incremental() %}
+built as (
+  select pickup_month, max(source_updated_at) as source_updated_at
+  from {{ this }}
+  group by 1
+),
+changed as (
+  select w.pickup_month, w.source_updated_at
+  from watermark w
+  left join built b using (pickup_month)
+  where b.source_updated_at is null
+     or w.source_updated_at > b.source_updated_at
+),
+{% else %}
+changed as (
+  select * from watermark
+),
+{% endif %}
+base as (
+  select t.*, c.pickup_month, c.source_updated_at
+  from {{ ref('fct_trips') }} t
+  join changed c
+    on c.pickup_month = date_trunc('month', t.pickup_ts)
+  where t.pickup_ts >= timestamp '2015-01-01'
+    and t.pickup_ts <  timestamp '2025-01-01'
+  {% if is_incremental() %}
+    {% if since is not none %}
+    and t.pickup_ts >= timestamp '{{ since }}'
+    {% else %}
+    and false
+    {% endif %}
+  {% endif %}
 ),
 em as (
   select
@@ -24,7 +113,8 @@ seconds as (
 )
 
 select
-  s.taxi_type,
+  -- 1-byte dictionary code instead of a repeated 'YELLOW'/'GREEN' string
+  s.taxi_type::enum('YELLOW', 'GREEN')                     as taxi_type,
   s.pickup_ts,
   s.dropoff_ts,
   s.passenger_count,
@@ -43,12 +133,19 @@ select
   -- CO2 in kilograms via live lookup, inner-join guarantees non-null
   (s.trip_distance * e.co2_grams_per_mile) / 1000.0        as trip_co2_kgs,
 
-  -- time features
-  extract('hour'  from s.pickup_ts)                        as hour_of_day,
-  extract('dow'   from s.pickup_ts)                        as day_of_week,
-  extract('week'  from s.pickup_ts)                        as week_of_year,
-  extract('month' from s.pickup_ts)                        as month_of_year
+  -- time features (extract returns BIGINT; all fit in one byte)
+  extract('hour'  from s.pickup_ts)::utinyint              as hour_of_day,
+  extract('dow'   from s.pickup_ts)::utinyint              as day_of_week,
+  extract('week'  from s.pickup_ts)::utinyint              as week_of_year,
+  extract('month' from s.pickup_ts)::utinyint              as month_of_year,
+
+  -- incremental bookkeeping
+  s.pickup_month,
+  s.source_updated_at
 
 from seconds s
 join em e
   on e.taxi_type = upper(s.taxi_type)
+
+-- clustered so pickup_ts zone maps let date-range reads skip row groups
+order by s.taxi_type, s.pickup_ts
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Parquet-lake storage backend (STORAGE_MODE=parquet).
+#
+# Raw and clean trips are written as Hive-partitioned Parquet under LAKE_DIR:
+#   <LAKE_DIR>/<layer>/taxi_type=YELLOW/year=2019/month=07/data.parquet
+# and emissions.duckdb only holds views over those files (plus the small bookkeeping
+# tables), so it never grows with the data and never needs VACUUM. The views expose the
+# year=/month= keys as INTEGER year/month columns: a filter on those skips every other
+# directory, while a filter on the pickup column alone still opens every file. Reloading a month
+# replaces that month's directory. Views use absolute paths, so LAKE_DIR must stay put
+# (dbt reads the same LAKE_DIR from the environment for the enriched layer).
+
+import glob
+import logging
+import os
+import shutil
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "duckdb")   # "duckdb" | "parquet"
+LAKE_DIR     = os.path.abspath(os.environ.get("LAKE_DIR", "lake"))
+
+# ZSTD compresses TLC columns noticeably better than the default Snappy; larger row groups
+# than DuckDB's 122,880-row default keep footers small while leaving several per month
+LAKE_COMPRESSION    = os.environ.get("LAKE_COMPRESSION", "zstd")
+LAKE_ROW_GROUP_SIZE = int(os.environ.get("LAKE_ROW_GROUP_SIZE", "500000"))
+
+def enabled() -> bool:
+    if STORAGE_MODE not in ("duckdb", "parquet"):
+        raise ValueError(f"Unknown STORAGE_MODE={STORAGE_MODE!r} (expected 'duckdb' or 'parquet')")
+    return STORAGE_MODE == "parquet"
+
+def _copy_options() -> str:
+    return f"FORMAT PARQUET, COMPRESSION {LAKE_COMPRESSION}, ROW_GROUP_SIZE {LAKE_ROW_GROUP_SIZE}"
+
+def layer_dir(layer: str, taxi_type: str) -> str:
+    return os.path.join(LAKE_DIR, layer, f"taxi_type={taxi_type.upper()}")
+
+def partition_file(layer: str, taxi_type: str, yyyy: int, mm: str) -> str:
+    return os.path.join(layer_dir(layer, taxi_type), f"year={yyyy}", f"month={mm}", "data.parquet")
+
+def _swap_in(tmp: str, final: str) -> None:
+    # Replace final with tmp; the old copy is only removed once the new one is in place
+    old = final + ".old"
+    if os.path.exists(old):
+        shutil.rmtree(old)
+    if os.path.exists(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    if os.path.exists(old):
+        shutil.rmtree(old)
+
+def write_partition(
+    con: duckdb.DuckDBPyConnection,
+    layer: str,
+    taxi_type: str,
+    yyyy: int,
+    mm: str,
+    select_sql: str
+) -> int:
+    """Write one (taxi_type, month) directory from select_sql, replacing any previous copy. Returns rows written."""
+    final = os.path.dirname(partition_file(layer, taxi_type, yyyy, mm))
+    tmp = final + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    rows = con.execute(
+        f"COPY ({select_sql}) TO '{os.path.join(tmp, 'data.parquet')}' ({_copy_options()});"
+    ).fetchone()[0]
+    _swap_in(tmp, final)
+    logger.info(f"Wrote {rows:,} rows to {final}")
+    return rows
+
+def write_layer(
+    con: duckdb.DuckDBPyConnection,
+    layer: str,
+    taxi_type: str,
+    select_sql: str,
+    pickup_col: str
+) -> int:
+    """Write a whole table as year=/month= partitions of one taxi type, replacing the previous layer."""
+    final = layer_dir(layer, taxi_type)
+    tmp = final + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    rows = con.execute(f"""
+        COPY (
+            SELECT *, year({pickup_col}) AS year, strftime({pickup_col}, '%m') AS month
+            FROM ({select_sql})
+        ) TO '{tmp}' ({_copy_options()}, PARTITION_BY (year, month), FILENAME_PATTERN 'data_{{i}}');
+    """).fetchone()[0]
+    _swap_in(tmp, final)
+    logger.info(f"Wrote {rows:,} rows to {final}")
+    return rows
+
+# Hive keys the views keep (taxi_type is constant per view and dropped)
+PARTITION_COLS = ("year", "month")
+
+def create_view(con: duckdb.DuckDBPyConnection, view: str, files) -> None:
+    """View over the given Parquet files (a list, or a glob) with INTEGER year/month partition columns."""
+    files = [files] if isinstance(files, str) else list(files)
+    listed = ", ".join(f"'{f}'" for f in files)
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {view} AS
+        SELECT * EXCLUDE (taxi_type)
+        FROM read_parquet(
+            [{listed}], hive_partitioning = true, hive_types = {{'year': INTEGER, 'month': INTEGER}},
+            union_by_name = true
+        );
+    """)
+
+def data_columns() -> str:
+    """Select list for a lake view's own columns (what a DuckDB-mode table of it would have)."""
+    return f"* EXCLUDE ({', '.join(PARTITION_COLS)})" if enabled() else "*"
+
+def partition_filter(partitions) -> str:
+    """Predicate on the partition columns matching exactly the given (year, month) pairs."""
+    listed = ", ".join(f"({int(y)}, {int(m)})" for y, m in sorted(partitions))
+    return f"(year, month) IN ({listed})" if listed else "FALSE"
+
+def layer_glob(layer: str, taxi_type: str) -> str:
+    return os.path.join(layer_dir(layer, taxi_type), "*", "*", "*.parquet")
+
+def has_files(layer: str, taxi_type: str) -> bool:
+    return bool(glob.glob(layer_glob(layer, taxi_type)))
+
+def remove_layer(layer: str) -> None:
+    path = os.path.join(LAKE_DIR, layer)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+        logger.info(f"Removed {path}")
@@ -5,6 +5,16 @@ import time
 import duckdb
 import logging
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common import COMMON_KEEP_COLS, LOAD_MANIFEST, RAW_PARTS_SCHEMA, reject_case, rule_predicates
+from tlc_cache import ParquetCache, source_identity
+import checkpoints
+import lake
+import planner
+import ratelimit
+import schema_registry
 
  # Logging setup
 logging.basicConfig(
@@ -16,19 +26,67 @@ logger = logging.getLogger(__name__)
 
 # Configuration from environment variables
 DB_PATH = os.environ.get("DB_PATH", "emissions.duckdb") # default DB path
-SLEEP_SECONDS = float(os.environ.get("SLEEP_SECONDS", "30.0"))  # configurable delay
+SLEEP_SECONDS = float(os.environ.get("SLEEP_SECONDS", "30.0"))  # initial delay between remote requests
+
+# Concurrent ingestion: LOAD_WORKERS > 1 fetches months in parallel into STAGING_DIR,
+# a single writer appends them; LOAD_MAX_RPS caps remote requests/second across all workers
+LOAD_WORKERS = int(os.environ.get("LOAD_WORKERS", "1"))
+LOAD_MAX_RPS = float(os.environ.get("LOAD_MAX_RPS", "1.0"))
+STAGING_DIR  = os.environ.get("STAGING_DIR", "staging")
+
+# Adaptive pacing (ratelimit.py): the request rate starts at 1/SLEEP_SECONDS (LOAD_MAX_RPS with
+# workers), climbs by LOAD_RPS_STEP per success up to LOAD_MAX_RPS and halves on 429/5xx/timeouts
+# (down to LOAD_MIN_RPS); a month failing that way is retried up to LOAD_RETRIES times in total
+LOAD_MIN_RPS      = float(os.environ.get("LOAD_MIN_RPS", "0.02"))
+LOAD_RPS_STEP     = float(os.environ.get("LOAD_RPS_STEP", "0.05"))
+LOAD_RETRIES      = int(os.environ.get("LOAD_RETRIES", "4"))
+LOAD_BACKOFF_BASE = float(os.environ.get("LOAD_BACKOFF_BASE", "2.0"))
+LOAD_BACKOFF_MAX  = float(os.environ.get("LOAD_BACKOFF_MAX", "120.0"))
 
 # Years/months to load (2015–2024)
 YEARS  = list(range(2015, 2025))
 MONTHS = [f"{m:02d}" for m in range(1, 13)]
 
-# Per-table resume points (YYYY-MM format) - set to skip earlier months when pausing the data loading because of lost connection
-RESUME_FROM_YELLOW = os.environ.get("RESUME_FROM_YELLOW")
-RESUME_FROM_GREEN  = os.environ.get("RESUME_FROM_GREEN")
+# Filter on ingest: apply clean.py's rules (common.CLEAN_RULES) while loading, so rejected
+# rows never reach the raw partitions; per-rule reject counts go to the load manifest
+FILTER_ON_INGEST = os.environ.get("FILTER_ON_INGEST", "0") == "1"
+INGEST_STAGE     = "ingest_month"   # temp table holding the month being filtered
+
+# Official TLC CloudFront Parquet URL patterns (TLC_BASE_URL may point at a mirror,
+# a local HTTP server or a local directory holding the same file names)
+TLC_BASE_URL = os.environ.get("TLC_BASE_URL", "https://d37ci6vzurychx.cloudfront.net/trip-data").rstrip("/")
+YELLOW_URL = TLC_BASE_URL + "/yellow_tripdata_{yyyy}-{mm}.parquet"
+GREEN_URL  = TLC_BASE_URL + "/green_tripdata_{yyyy}-{mm}.parquet"
+
+# Optional local download cache: set TLC_CACHE_DIR to read each month from a local copy;
+# TLC_CACHE_MAX_BYTES bounds it (LRU, 0 = unlimited); TLC_OFFLINE=1 never touches the network
+TLC_CACHE_DIR       = os.environ.get("TLC_CACHE_DIR", "")
+TLC_CACHE_MAX_BYTES = int(os.environ.get("TLC_CACHE_MAX_BYTES", "0"))
+TLC_OFFLINE         = os.environ.get("TLC_OFFLINE", "0") == "1"
+CACHE = ParquetCache(TLC_CACHE_DIR, TLC_CACHE_MAX_BYTES, TLC_OFFLINE) if TLC_CACHE_DIR else None
+
+# Only requests to a remote TLC_BASE_URL are paced (a local directory or offline cache is not)
+REMOTE = TLC_BASE_URL.startswith(("http://", "https://")) and not TLC_OFFLINE
+LIMITER = ratelimit.AdaptiveLimiter(
+    rate=LOAD_MAX_RPS if LOAD_WORKERS > 1 or SLEEP_SECONDS <= 0 else 1.0 / SLEEP_SECONDS,
+    min_rps=LOAD_MIN_RPS,
+    max_rps=LOAD_MAX_RPS,
+    increase=LOAD_RPS_STEP,
+)
+
+def _acquire() -> None:
+    if REMOTE:
+        LIMITER.acquire()
 
-# Official TLC CloudFront Parquet URL patterns
-YELLOW_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{yyyy}-{mm}.parquet"
-GREEN_URL  = "https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_{yyyy}-{mm}.parquet"
+def _with_retries(fn, label: str):
+    return ratelimit.with_retries(
+        fn, LIMITER, label, attempts=LOAD_RETRIES, backoff_base=LOAD_BACKOFF_BASE, backoff_max=LOAD_BACKOFF_MAX
+    )
+
+def _source_for(url: str, head_info=None) -> str:
+    # Local cached copy when the cache is enabled, otherwise the URL itself; head_info is
+    # the HEAD already made for the fingerprint, so the cache does not repeat it
+    return CACHE.resolve(url, head_info) if CACHE is not None else url
 
 # Pause/Stop flags for interactive control
 PAUSE_FILE = "PAUSE.LOAD"
@@ -40,23 +98,6 @@ def _maybe_pause():
         logger.info("PAUSED: remove PAUSE.LOAD to continue…")
         time.sleep(3)
 
-# Columns to keep (trimmed to reduce DB size and speed up queries)
-COMMON_KEEP_COLS = [
-    "VendorID",
-    "passenger_count",
-    "trip_distance",
-    "RatecodeID",
-    "store_and_fwd_flag",
-    "PULocationID", "DOLocationID",
-    "payment_type",
-    "fare_amount", "extra", "mta_tax",
-    "tip_amount", "tolls_amount",
-    "improvement_surcharge",
-    "total_amount",
-    "congestion_surcharge",
-    "airport_fee",
-]
-
 # Desired column types (broad to allow coercion from files)
 TYPE_MAP_BASE = {
     "VendorID": "INTEGER",
@@ -100,84 +141,285 @@ def _type_map_for(table_name: str):
         tmap["lpep_dropoff_datetime"] = "TIMESTAMP"
     return tmap
 
-# Table schema management, in case a table shows an error on insert
-def _ensure_table_schema(con: duckdb.DuckDBPyConnection, table_name: str, keep_cols, type_map):
+# Manifest and per-month partitions (replaces the DELETE-by-month idempotency)
+
+def _taxi_type(table_name: str) -> str:
+    return "yellow" if "yellow" in table_name else "green"
+
+def _partition_table(table_name: str, yyyy: int, mm: str) -> str:
+    return f'{RAW_PARTS_SCHEMA}."{table_name}_{yyyy}_{mm}"'
+
+def _ensure_manifest(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
     """
-    Create the table if it doesn't exist with all keep_cols and our desired types.
-    If it exists, add any missing keep columns.
+    Create the partition schema and load_manifest if missing.
+    A raw table loaded before the manifest existed cannot be split back into months,
+    so refuse to continue rather than silently loading everything twice.
     """
-    exists = bool(con.execute(f"""
+    legacy = con.execute("""
         SELECT COUNT(*)
         FROM information_schema.tables
-        WHERE table_schema = 'main' AND table_name = '{table_name}'
-    """).fetchone()[0])
+        WHERE table_schema = 'main' AND table_name = ? AND table_type = 'BASE TABLE'
+    """, [table_name]).fetchone()[0]
+    if legacy:
+        raise RuntimeError(
+            f"{table_name} is a single table from a pre-manifest load; "
+            f"drop or rename it so months can be reloaded into {RAW_PARTS_SCHEMA}."
+        )
 
-    if not exists:
-        cols_def = ",\n".join(f'"{c}" {type_map[c]}' for c in keep_cols)
-        con.execute(f'CREATE TABLE {table_name} ({cols_def});')
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {RAW_PARTS_SCHEMA};")
+    schema_registry.ensure_registry(con)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_MANIFEST} (
+            taxi_type          VARCHAR,
+            month              DATE,
+            source_fingerprint VARCHAR,
+            row_count          BIGINT,
+            loaded_at          TIMESTAMP,
+            status             VARCHAR,   -- 'loaded' | 'failed' | 'purged'
+            PRIMARY KEY (taxi_type, month)
+        );
+    """)
+    # Filter-on-ingest bookkeeping (added to manifests created before it existed)
+    con.execute(f"ALTER TABLE {LOAD_MANIFEST} ADD COLUMN IF NOT EXISTS filtered BOOLEAN;")
+    con.execute(f"ALTER TABLE {LOAD_MANIFEST} ADD COLUMN IF NOT EXISTS source_rows BIGINT;")
+    con.execute(f"ALTER TABLE {LOAD_MANIFEST} ADD COLUMN IF NOT EXISTS rejects MAP(VARCHAR, BIGINT);")
+
+def _loaded_fingerprints(con: duckdb.DuckDBPyConnection, table_name: str) -> dict:
+    """
+    (yyyy, mm) -> source fingerprint for every month currently loaded in the current
+    FILTER_ON_INGEST mode (switching the mode reloads every month once).
+    """
+    rows = con.execute(f"""
+        SELECT month, source_fingerprint
+        FROM {LOAD_MANIFEST}
+        WHERE taxi_type = ? AND status = 'loaded' AND COALESCE(filtered, false) = ?
+    """, [_taxi_type(table_name), FILTER_ON_INGEST]).fetchall()
+    return {(m.year, f"{m.month:02d}"): fp for m, fp in rows}
+
+def _refresh_raw_view(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    # main.<table_name> = UNION ALL of the loaded months (or their lake files), in calendar order
+    months = con.execute(f"""
+        SELECT month FROM {LOAD_MANIFEST}
+        WHERE taxi_type = ? AND status = 'loaded'
+        ORDER BY month
+    """, [_taxi_type(table_name)]).fetchall()
+    if not months:
+        con.execute(f"DROP VIEW IF EXISTS {table_name};")
+        return
+    if lake.enabled():
+        lake.create_view(con, table_name, [
+            lake.partition_file("raw", _taxi_type(table_name), m.year, f"{m.month:02d}") for (m,) in months
+        ])
         return
+    parts = "\nUNION ALL\n".join(
+        f"SELECT * FROM {_partition_table(table_name, m.year, f'{m.month:02d}')}" for (m,) in months
+    )
+    con.execute(f"CREATE OR REPLACE VIEW {table_name} AS\n{parts};")
+
+def _ingest_filter(table_name: str):
+    """(rules, reject CASE expression) over this table's raw columns."""
+    keep_cols, _ = _keep_cols_for(table_name)
+    rules = rule_predicates(f'"{keep_cols[0]}"', f'"{keep_cols[1]}"')
+    return rules, reject_case(rules)
+
+def _commit_month(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    yyyy: int,
+    mm: str,
+    select_sql: str,
+    fingerprint: str
+) -> int:
+    """
+    Write one month as its own table and mark it loaded, atomically: the partition,
+    the manifest row and the view change commit together, so a crash never leaves a
+    half-loaded month and a reload replaces only this month (no table-wide DELETE).
+    With STORAGE_MODE=parquet the month goes to its lake directory instead.
+    With FILTER_ON_INGEST only rows passing every cleaning rule are written, and the
+    per-rule reject counts (first rule that rejected the row) are kept in the manifest.
+    The source is read once, into a temp table tagged with each row's reject rule; the
+    counts and the written rows both come from it, so a remote month is fetched once
+    (under the caller's pacing) rather than once for the counts and again for the data.
+    """
+    part = _partition_table(table_name, yyyy, mm)
+    source_rows, rejects = None, None
+    data_sql = select_sql
+    if FILTER_ON_INGEST:
+        rules, reject = _ingest_filter(table_name)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {INGEST_STAGE} AS
+            SELECT *, {reject} AS reject_rule FROM ({select_sql});
+        """)
+        filters = ", ".join(f"COUNT(*) FILTER (WHERE reject_rule = {i})" for i in range(1, len(rules) + 1))
+        counts = con.execute(f"SELECT COUNT(*), {filters} FROM {INGEST_STAGE};").fetchone()
+        source_rows = counts[0]
+        rejects = {label: n for (_, label, _), n in zip(rules, counts[1:])}
+        data_sql = f"SELECT * EXCLUDE (reject_rule) FROM {INGEST_STAGE} WHERE reject_rule = 0"
+
+    # Parquet lake: the month's directory is swapped in first; the manifest row and view
+    # follow in one transaction, so a crash in between only means the month is refetched
+    row_count = None
+    if lake.enabled():
+        row_count = lake.write_partition(con, "raw", _taxi_type(table_name), yyyy, mm, data_sql)
+
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        if row_count is None:
+            con.execute(f"CREATE OR REPLACE TABLE {part} AS {data_sql};")
+            row_count = con.execute(f"SELECT COUNT(*) FROM {part};").fetchone()[0]
+        con.execute(f"""
+            INSERT OR REPLACE INTO {LOAD_MANIFEST}
+                (taxi_type, month, source_fingerprint, row_count, loaded_at, status, filtered, source_rows, rejects)
+            VALUES (?, DATE '{yyyy}-{mm}-01', ?, ?, now(), 'loaded', ?, ?, ?);
+        """, [_taxi_type(table_name), fingerprint, row_count, FILTER_ON_INGEST, source_rows, rejects])
+        _refresh_raw_view(con, table_name)
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+    finally:
+        if FILTER_ON_INGEST:
+            con.execute(f"DROP TABLE IF EXISTS {INGEST_STAGE};")
+    if rejects:
+        logger.info(f"{table_name} {yyyy}-{mm}: filtered on ingest, {source_rows:,} read, rejected {rejects}")
+    return row_count
+
+def _record_failure(con: duckdb.DuckDBPyConnection, table_name: str, yyyy: int, mm: str) -> None:
+    # A failed refresh keeps the previously loaded partition (and its manifest row) intact
+    con.execute(f"""
+        INSERT INTO {LOAD_MANIFEST} (taxi_type, month, loaded_at, status)
+        VALUES (?, DATE '{yyyy}-{mm}-01', now(), 'failed')
+        ON CONFLICT (taxi_type, month) DO UPDATE
+            SET loaded_at = excluded.loaded_at, status = 'failed'
+            WHERE {LOAD_MANIFEST}.status <> 'loaded';
+    """, [_taxi_type(table_name)])
+
+def _finish_table(con: duckdb.DuckDBPyConnection, table_name: str, skipped, unchanged: int) -> None:
+    loaded = _loaded_fingerprints(con, table_name)
+    if not loaded:
+        raise RuntimeError(f"Could not create {table_name}; no reachable months at all.")
+    logger.info(f"{table_name}: {len(loaded)} months loaded, {unchanged} unchanged and skipped this run")
+    print(f"{table_name}: {len(loaded)} months loaded ({unchanged} unchanged this run)")
+    if REMOTE:
+        logger.info(f"{table_name}: remote requests so far: {LIMITER.summary()}")
+        print(f"{table_name}: remote requests so far: {LIMITER.summary()}")
+
+    if FILTER_ON_INGEST:
+        totals = {}
+        for (rejects,) in con.execute(f"""
+            SELECT rejects FROM {LOAD_MANIFEST}
+            WHERE taxi_type = ? AND status = 'loaded' AND filtered
+        """, [_taxi_type(table_name)]).fetchall():
+            for label, n in (rejects or {}).items():
+                totals[label] = totals.get(label, 0) + n
+        for label, n in totals.items():
+            logger.info(f"{table_name}: rejected on ingest {label} = {n:,}")
+            print(f"{table_name}: rejected on ingest {label} = {n:,}")
+    if skipped:
+        logger.warning(f"{table_name}: skipped months: {skipped}")
+        print(f"{table_name}: skipped {len(skipped)} months (first few: {skipped[:6]})")
 
-    # Adding any missing keep columns (DuckDB PRAGMA table_info: column name at index 1)
-    present = {row[1] for row in con.execute(f"PRAGMA table_info('{table_name}')").fetchall()}
-    for c in keep_cols:
-        if c not in present:
-            con.execute(f'ALTER TABLE {table_name} ADD COLUMN "{c}" {type_map[c]};')
+    # Distinct source schemas seen so far (e.g. when congestion_surcharge / airport_fee appear)
+    for line in schema_registry.epoch_report(con, _taxi_type(table_name)):
+        logger.info(f"{table_name} schema {line}")
+        print(f"{table_name} schema {line}")
 
 # Build a SELECT list that projects only keep_cols in the right order.
-def _build_projection_for_file(con: duckdb.DuckDBPyConnection, url: str, keep_cols, type_map) -> str:
+def _projection_for_columns(file_cols, keep_cols, type_map) -> str:
     """
-    Build a SELECT list that projects only keep_cols in the right order.
+    Build a SELECT list that projects only keep_cols in the right order, cast to our types
+    so every monthly partition has the same schema.
     Use CAST(NULL AS type) AS col for any keep column missing from the file.
     """
-    file_desc = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{url}')").fetchall()
-    file_cols = {row[0] for row in file_desc}
     exprs = []
     for c in keep_cols:
         if c in file_cols:
-            exprs.append(f'"{c}"')
+            exprs.append(f'CAST("{c}" AS {type_map[c]}) AS "{c}"')
         else:
             exprs.append(f'CAST(NULL AS {type_map[c]}) AS "{c}"')
     return ", ".join(exprs)
 
-# DuckDB connection setup
-def _connect() -> duckdb.DuckDBPyConnection:
-    con = duckdb.connect(database=DB_PATH, read_only=False)
+def _resolve_projection(con: duckdb.DuckDBPyConnection, src: str, known_columns, keep_cols, type_map):
+    """
+    Projection for one file, built from its registered column names when this exact file
+    (name + fingerprint) was seen before, otherwise from a DESCRIBE of the footer. Returns
+    (projection, columns), with columns None when the registry answered and nothing needs
+    registering.
+    """
+    if known_columns is not None:
+        return _projection_for_columns(set(known_columns), keep_cols, type_map), None
+    columns = schema_registry.describe_columns(con, src)
+    return _projection_for_columns({name for name, _ in columns}, keep_cols, type_map), columns
+
+def _register_schema(con, table_name, url, fingerprint, yyyy, mm, columns, known) -> None:
+    file_name = os.path.basename(url)
+    schema_registry.register(con, _taxi_type(table_name), file_name, fingerprint, f"{yyyy}-{mm}-01", columns)
+    known[(file_name, fingerprint)] = [name for name, _ in columns]
+
+# Remote-reading settings shared by the main and worker connections
+def _configure_remote_reads(con: duckdb.DuckDBPyConnection) -> None:
     con.execute("INSTALL httpfs;")
     con.execute("LOAD httpfs;")
-    con.execute("PRAGMA enable_progress_bar=true;")
     con.execute("PRAGMA enable_object_cache=true;")
     con.execute("SET http_keep_alive=true;")
 
-    # If running out of storage, move temp files to a different directory
-    tmp_dir = os.environ.get("DUCKDB_TEMP_DIR")
-    if tmp_dir:
-        os.makedirs(tmp_dir, exist_ok=True)
-        con.execute(f"PRAGMA temp_directory='{tmp_dir}';")
+# DuckDB connection setup
+def _connect() -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect(database=DB_PATH, read_only=False)
+    _configure_remote_reads(con)
+    con.execute("PRAGMA enable_progress_bar=true;")
 
     version = con.execute("SELECT version()").fetchone()[0]
     logger.info(f"DuckDB version: {version}")
     print(f"Using DB_PATH={DB_PATH} (DuckDB {version})")
     return con
 
-# Rate-limited, sequential inserter (resume-safe + trimmed columns)
+# Preflight: memory/threads for the inserts and a disk check for the months still to load
+
+def _preflight(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Months still to load are assumed to be as large as the average month already loaded
+    (nothing is known on a first run). Each insert streams its Parquet file, so the working
+    set is small whatever LOAD_WORKERS is.
+    """
+    loaded = 0
+    if con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?;",
+        [LOAD_MANIFEST],
+    ).fetchone()[0]:
+        loaded = con.execute(f"SELECT COUNT(*) FROM {LOAD_MANIFEST} WHERE status = 'loaded';").fetchone()[0]
+    if lake.enabled():
+        stored, write_path = planner.dir_bytes(os.path.join(lake.LAKE_DIR, "raw")), lake.LAKE_DIR
+    else:
+        stored, write_path = planner.schema_stored_bytes(con, RAW_PARTS_SCHEMA), DB_PATH
+    remaining = 2 * len(YEARS) * len(MONTHS) - loaded
+    write_bytes = remaining * stored // loaded if loaded else 0
+    logger.info(f"Preflight: {loaded} months loaded ({stored:,} bytes), up to {remaining} to go")
+    planner.apply(con, planner.plan("load", [("streaming", 0)], write_bytes, db_path=DB_PATH, write_path=write_path))
+
+# Rate-limited, sequential inserter (manifest-driven resume + trimmed columns)
 
 def _insert_rate_limited(
     con: duckdb.DuckDBPyConnection,
     table_name: str,
-    base_url: str,
-    sleep_seconds: float = SLEEP_SECONDS
+    base_url: str
 ) -> None:
     """
-    2015–2024, month-by-month with a pause between months.
-    Resume-safe: deletes that month’s rows before re-inserting.
+    2015–2024, month-by-month, remote requests paced by LIMITER and transient failures retried.
+    Months already loaded from an unchanged source (per load_manifest) are skipped,
+    so a rerun after a crash resumes by itself; changed months replace their partition.
     Projects only the necessary columns to keep DB small.
     Supports PAUSE.LOAD and STOP.LOAD files for control.
     """
-    created = False
     skipped = []
+    unchanged = 0
 
-    keep_cols, pickup_col = _keep_cols_for(table_name)
+    keep_cols, _ = _keep_cols_for(table_name)
     type_map = _type_map_for(table_name)
+    _ensure_manifest(con, table_name)
+    loaded = _loaded_fingerprints(con, table_name)
+    known = schema_registry.known_columns(con, _taxi_type(table_name))
+    ckpt = checkpoints.CheckpointPolicy(con, f"load {table_name}")
 
     for yyyy in YEARS:
         for mm in MONTHS:
@@ -185,70 +427,222 @@ def _insert_rate_limited(
             if os.path.exists(STOP_FILE):
                 logger.info("STOP.LOAD detected — exiting gracefully.")
                 print("STOP requested — exiting after current checkpoint.")
+                ckpt.end("STOP")
                 return
 
             _maybe_pause()  # optional pause between months
 
-            # Per-table resume gate
-            resume_from = RESUME_FROM_YELLOW if "yellow" in table_name else RESUME_FROM_GREEN
-            if resume_from:
-                ry, rm = map(int, resume_from.split("-"))
-                if (yyyy < ry) or (yyyy == ry and int(mm) < rm):
-                    time.sleep(0.01)  # tiny yield so logs stay readable
-                    continue
-
             url = base_url.format(yyyy=yyyy, mm=mm)
-            month_start = f"{yyyy}-{mm}-01"
-
-            try:
-                # Ensure table exists with target schema
-                if not created:
-                    _ensure_table_schema(con, table_name, keep_cols, type_map)
-                    created = True
 
-                # Build projection (NULL casts for missing columns in this file)
-                select_list = _build_projection_for_file(con, url, keep_cols, type_map)
-
-                # Idempotency: remove any previously inserted rows for this month
-                con.execute(f"""
-                    DELETE FROM {table_name}
-                    WHERE "{pickup_col}" >= DATE '{month_start}'
-                      AND "{pickup_col}" <  (DATE '{month_start}' + INTERVAL 1 MONTH);
-                """)
+            def _load_month():
+                # Skip months whose source is unchanged since they were loaded
+                _acquire()
+                fingerprint, head_info = source_identity(url, CACHE)
+                if loaded.get((yyyy, mm)) == fingerprint:
+                    return None, fingerprint
+
+                # Local copy when caching, so the footer and data are read from disk
+                _acquire()
+                src = _source_for(url, head_info)
+
+                # Build projection (NULL casts for missing columns in this file);
+                # files already in the schema registry skip the DESCRIBE
+                select_list, columns = _resolve_projection(
+                    con, src, known.get((os.path.basename(url), fingerprint)), keep_cols, type_map
+                )
+                if columns is not None:
+                    _register_schema(con, table_name, url, fingerprint, yyyy, mm, columns, known)
 
                 logger.info(f"Inserting {table_name} ← {url}")
-                con.execute(f"""
-                    INSERT INTO {table_name}
-                    SELECT {select_list}
-                    FROM read_parquet('{url}');
-                """)
+                rows = _commit_month(
+                    con, table_name, yyyy, mm,
+                    f"SELECT {select_list} FROM read_parquet('{src}')",
+                    fingerprint,
+                )
+                return rows, fingerprint
+
+            try:
+                rows, fingerprint = _with_retries(_load_month, f"{table_name} {yyyy}-{mm}")
+                if rows is None:
+                    logger.info(f"UNCHANGED: {table_name} {yyyy}-{mm} ({fingerprint})")
+                    unchanged += 1
+                    continue
 
-                # Keep WAL small after each month
-                con.execute("PRAGMA force_checkpoint;")
+                # The month is durable once committed; fold the WAL in when the policy says so
+                ckpt.after(f"{yyyy}-{mm}")
 
                 logger.info(f"OK: {table_name} {yyyy}-{mm}")
+                logger.info(f"{table_name} {yyyy}-{mm}: {rows:,} rows; rate {LIMITER.rate:.2f} req/s")
                 print(f"OK: {table_name} {yyyy}-{mm}")
 
             except Exception as e:
                 logger.warning(f"SKIP {table_name} {yyyy}-{mm}: {e}")
                 print(f"SKIP: {table_name} {yyyy}-{mm} ({str(e)[:160]})")
                 skipped.append((yyyy, mm))
+                _record_failure(con, table_name, yyyy, mm)
+
+    ckpt.end()
+    _finish_table(con, table_name, skipped, unchanged)
+
+# Concurrent inserter: N fetch workers stage months as Parquet, one writer commits them
+
+def _stage_month(
+    url: str,
+    stage_path: str,
+    keep_cols,
+    type_map,
+    loaded_fingerprint,
+    known: dict,
+    threads: int
+):
+    """
+    Worker: read one month into a local Parquet file with its own in-memory DuckDB,
+    so fetches never contend for the database file.
+    Returns (stage_path, fingerprint, columns); stage_path is None when the
+    source is unchanged, columns is None when the schema registry already knew the file.
+    """
+    _acquire()
+    fingerprint, head_info = source_identity(url, CACHE)
+    if fingerprint == loaded_fingerprint:
+        return None, fingerprint, None
 
-            time.sleep(sleep_seconds)  # gentle rate limit
+    wcon = duckdb.connect()
+    try:
+        _configure_remote_reads(wcon)
+        wcon.execute(f"SET threads={threads};")
+        _acquire()
+        src = _source_for(url, head_info)
+        select_list, columns = _resolve_projection(
+            wcon, src, known.get((os.path.basename(url), fingerprint)), keep_cols, type_map
+        )
+        if src == url and columns is not None:
+            _acquire()  # uncached: the COPY below is a second remote request
+        tmp_path = stage_path + ".part"
+        wcon.execute(f"""
+            COPY (SELECT {select_list} FROM read_parquet('{src}'))
+            TO '{tmp_path}' (FORMAT parquet);
+        """)
+        os.replace(tmp_path, stage_path)  # only complete files carry the final name
+        return stage_path, fingerprint, columns
+    finally:
+        wcon.close()
 
-    if not created:
-        raise RuntimeError(f"Could not create {table_name}; no reachable months at all.")
-    if skipped:
-        logger.warning(f"{table_name}: skipped months: {skipped}")
-        print(f"{table_name}: skipped {len(skipped)} months (first few: {skipped[:6]})")
+def _insert_concurrent(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    base_url: str,
+    workers: int = LOAD_WORKERS
+) -> None:
+    """
+    2015–2024 with up to `workers` months fetched at once, remote requests paced by LIMITER
+    (at most LOAD_MAX_RPS) and transient failures retried in the worker. Staged months are committed by this (the only writing) thread in
+    calendar order through the same manifest/partition path as the sequential loader.
+    At most 2 * workers staged months exist on disk at any time.
+    Supports PAUSE.LOAD and STOP.LOAD files for control.
+    """
+    skipped = []
+    unchanged = 0
+
+    keep_cols, _ = _keep_cols_for(table_name)
+    type_map = _type_map_for(table_name)
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    _ensure_manifest(con, table_name)
+    loaded = _loaded_fingerprints(con, table_name)
+    known = schema_registry.known_columns(con, _taxi_type(table_name))
+    ckpt = checkpoints.CheckpointPolicy(con, f"load {table_name}")
+
+    months = [(yyyy, mm) for yyyy in YEARS for mm in MONTHS]
+    worker_threads = max(1, (os.cpu_count() or 1) // workers)
+    logger.info(f"{table_name}: concurrent load of {len(months)} months, workers={workers}, max_rps={LOAD_MAX_RPS}")
+
+    pending = deque()
+    todo = iter(months)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"fetch-{table_name}") as pool:
+        def _submit_next() -> bool:
+            for yyyy, mm in todo:
+                url = base_url.format(yyyy=yyyy, mm=mm)
+                stage_path = os.path.join(STAGING_DIR, f"{table_name}_{yyyy}-{mm}.parquet")
+                fut = pool.submit(
+                    _with_retries,
+                    lambda url=url, stage_path=stage_path, yyyy=yyyy, mm=mm: _stage_month(
+                        url, stage_path, keep_cols, type_map, loaded.get((yyyy, mm)), dict(known), worker_threads,
+                    ),
+                    f"{table_name} {yyyy}-{mm}",
+                )
+                pending.append((yyyy, mm, url, fut))
+                return True
+            return False
+
+        while len(pending) < 2 * workers and _submit_next():
+            pass
+
+        while pending:
+            # honor STOP after previous month
+            if os.path.exists(STOP_FILE):
+                logger.info("STOP.LOAD detected — exiting gracefully.")
+                print("STOP requested — exiting after current checkpoint.")
+                for *_, fut in pending:
+                    fut.cancel()
+                ckpt.end("STOP")
+                return
+
+            _maybe_pause()  # optional pause between months
+
+            yyyy, mm, url, fut = pending.popleft()
+            stage_path = None
+
+            try:
+                stage_path, fingerprint, columns = fut.result()
+                if columns is not None:
+                    _register_schema(con, table_name, url, fingerprint, yyyy, mm, columns, known)
+
+                if stage_path is None:
+                    logger.info(f"UNCHANGED: {table_name} {yyyy}-{mm} ({fingerprint})")
+                    unchanged += 1
+                else:
+                    logger.info(f"Inserting {table_name} ← {url} (staged at {stage_path})")
+                    rows = _commit_month(
+                        con, table_name, yyyy, mm,
+                        f"SELECT * FROM read_parquet('{stage_path}')",
+                        fingerprint,
+                    )
+
+                    # The month is durable once committed; fold the WAL in when the policy says so
+                    ckpt.after(f"{yyyy}-{mm}")
+
+                    logger.info(f"OK: {table_name} {yyyy}-{mm}")
+                    logger.info(f"{table_name} {yyyy}-{mm}: {rows:,} rows; rate {LIMITER.rate:.2f} req/s")
+                    print(f"OK: {table_name} {yyyy}-{mm}")
+
+            except Exception as e:
+                logger.warning(f"SKIP {table_name} {yyyy}-{mm}: {e}")
+                print(f"SKIP: {table_name} {yyyy}-{mm} ({str(e)[:160]})")
+                skipped.append((yyyy, mm))
+                _record_failure(con, table_name, yyyy, mm)
+
+            finally:
+                if stage_path and os.path.exists(stage_path):
+                    os.remove(stage_path)
+
+            _submit_next()
+
+    ckpt.end()
+    _finish_table(con, table_name, skipped, unchanged)
 
 # Yellow / Green loaders
 
+def _load_table(con: duckdb.DuckDBPyConnection, table_name: str, base_url: str) -> None:
+    if LOAD_WORKERS > 1:
+        _insert_concurrent(con, table_name, base_url, workers=LOAD_WORKERS)
+    else:
+        _insert_rate_limited(con, table_name, base_url)
+
 def load_yellow(con: duckdb.DuckDBPyConnection) -> None:
-    _insert_rate_limited(con, "raw_yellow_all", YELLOW_URL, sleep_seconds=SLEEP_SECONDS)
+    _load_table(con, "raw_yellow_all", YELLOW_URL)
 
 def load_green(con: duckdb.DuckDBPyConnection) -> None:
-    _insert_rate_limited(con, "raw_green_all", GREEN_URL, sleep_seconds=SLEEP_SECONDS)
+    _load_table(con, "raw_green_all", GREEN_URL)
 
 # Vehicle emissions loader (CSV -> normalized 2-column lookup)
 
@@ -310,6 +704,11 @@ def main() -> None:
     try:
         con = _connect()
         logger.info("Connected to DuckDB instance")
+        if lake.enabled():
+            logger.info(f"Storage mode: parquet lake at {lake.LAKE_DIR}")
+
+        # Refuses to start when the remaining months will not fit on disk
+        _preflight(con)
 
         # 1) Yellow trips 2015–2024 (resume-safe, trimmed columns)
         load_yellow(con)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Preflight resource planner shared by load.py, clean.py and analysis.py.
+#
+# Before a heavy step the stage lists its strategies as (name, working-set bytes), best first,
+# plus the bytes the step adds to disk. The planner reads the available RAM, CPU count and free
+# space on the database and temp filesystems, chooses memory_limit, threads and
+# max_temp_directory_size, and keeps the first strategy whose working set fits in memory plus
+# temp. When none fits, or the output will not fit on disk, it refuses to start the step
+# (RuntimeError) instead of failing hours in with a full disk; PLANNER_FORCE=1 only warns.
+#
+# MEMORY_LIMIT, DUCKDB_THREADS, MAX_TEMP_DIR_SIZE and DUCKDB_TEMP_DIR still override the
+# planner's choices when set (a temp size larger than the free space is capped to it).
+
+import glob
+import logging
+import os
+import shutil
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+MEMORY_LIMIT      = os.environ.get("MEMORY_LIMIT", "")
+THREADS           = os.environ.get("DUCKDB_THREADS", "")
+MAX_TEMP_DIR_SIZE = os.environ.get("MAX_TEMP_DIR_SIZE", "")
+DUCKDB_TEMP_DIR   = os.environ.get("DUCKDB_TEMP_DIR", "")
+
+# Share of the available RAM given to DuckDB, and the RAM each thread should have
+# (DuckDB's guidance is 1-4 GB per thread for aggregations and sorts)
+PLANNER_MEMORY_FRACTION = float(os.environ.get("PLANNER_MEMORY_FRACTION", "0.75"))
+PLANNER_MEMORY_PER_THREAD = os.environ.get("PLANNER_MEMORY_PER_THREAD", "1GiB")
+# Left free on every filesystem the step writes to
+PLANNER_DISK_RESERVE = os.environ.get("PLANNER_DISK_RESERVE", "2GiB")
+PLANNER_FORCE = os.environ.get("PLANNER_FORCE", "0") == "1"
+
+_UNITS = {"B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12,
+          "KIB": 2**10, "MIB": 2**20, "GIB": 2**30, "TIB": 2**40}
+
+def parse_bytes(size: str) -> int:
+    text = size.strip().upper()
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * _UNITS[unit])
+    return int(float(text))
+
+def fmt_bytes(n: int) -> str:
+    return f"{n / 2**30:,.1f} GiB" if n >= 2**30 else f"{n / 2**20:,.1f} MiB"
+
+# Machine
+
+def available_ram() -> int:
+    """MemAvailable, capped by the cgroup (container) limit when there is one."""
+    avail = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    avail = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f:
+            used = int(f.read().strip())
+        if limit != "max":
+            avail = min(avail, int(limit) - used)
+    except (OSError, ValueError):
+        pass
+    return max(avail, 0)
+
+def _existing(path: str) -> str:
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+def free_disk(path: str) -> int:
+    return shutil.disk_usage(_existing(path)).free
+
+def _same_fs(a: str, b: str) -> bool:
+    return os.stat(_existing(a)).st_dev == os.stat(_existing(b)).st_dev
+
+# Data
+
+# In-memory bytes per value; VARCHAR and anything unlisted count as a 16-byte string_t
+_TYPE_BYTES = {
+    "BOOLEAN": 1, "TINYINT": 1, "UTINYINT": 1, "SMALLINT": 2, "USMALLINT": 2,
+    "INTEGER": 4, "UINTEGER": 4, "BIGINT": 8, "UBIGINT": 8, "HUGEINT": 16,
+    "FLOAT": 4, "DOUBLE": 8, "DATE": 4, "TIME": 8, "TIMESTAMP": 8, "TIMESTAMP WITH TIME ZONE": 8,
+}
+
+def row_bytes(con: duckdb.DuckDBPyConnection, relation: str) -> int:
+    types = [row[1] for row in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()]
+    return sum(
+        _TYPE_BYTES.get(t, 8 if t.startswith("DECIMAL") else 1 if t.startswith("ENUM") else 16)
+        for t in types
+    )
+
+def estimated_rows(con: duckdb.DuckDBPyConnection, table: str):
+    """DuckDB's catalog row estimate for a base table of the current database (no scan); None for a view."""
+    row = con.execute(
+        "SELECT estimated_size FROM duckdb_tables() WHERE database_name = current_database() AND table_name = ?",
+        [table],
+    ).fetchone()
+    return row[0] if row else None
+
+def stored_bytes(con: duckdb.DuckDBPyConnection, table: str) -> int:
+    """Bytes of the blocks holding a table's checkpointed data (small tables share blocks, so this errs high)."""
+    blocks = con.execute(f"""
+        SELECT COUNT(DISTINCT block_id)
+        FROM pragma_storage_info('{table}')
+        WHERE persistent AND block_id >= 0
+    """).fetchone()[0]
+    block_size = con.execute(
+        "SELECT block_size FROM pragma_database_size() WHERE database_name = current_database()"
+    ).fetchone()[0]
+    return blocks * block_size
+
+def schema_stored_bytes(con: duckdb.DuckDBPyConnection, schema: str) -> int:
+    tables = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE database_name = current_database() AND schema_name = ?",
+        [schema],
+    ).fetchall()
+    return sum(stored_bytes(con, f"{schema}.{t}") for (t,) in tables)
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(f) for f in glob.glob(os.path.join(path, "**", "*"), recursive=True)
+               if os.path.isfile(f))
+
+# Planning
+
+def plan(
+    step: str,
+    candidates,
+    write_bytes: int = 0,
+    db_path: str = "emissions.duckdb",
+    write_path: str = None
+) -> dict:
+    """
+    Resources and strategy for one step. candidates: [(strategy, working-set bytes)], best first;
+    write_bytes: what the step adds under write_path (default: next to db_path).
+    Raises RuntimeError when nothing fits.
+    """
+    ram = available_ram()
+    memory_limit = parse_bytes(MEMORY_LIMIT) if MEMORY_LIMIT else int(ram * PLANNER_MEMORY_FRACTION)
+    cpus = os.cpu_count() or 1
+    threads = int(THREADS) if THREADS else max(1, min(cpus, memory_limit // parse_bytes(PLANNER_MEMORY_PER_THREAD)))
+
+    # DuckDB's own default temp directory is <database>.tmp
+    temp_dir = DUCKDB_TEMP_DIR or db_path + ".tmp"
+    reserve = parse_bytes(PLANNER_DISK_RESERVE)
+    write_path = write_path or db_path
+    db_free = max(free_disk(write_path) - reserve, 0)
+    temp_free = max(free_disk(temp_dir) - reserve, 0)
+    if _same_fs(write_path, temp_dir):
+        temp_free = max(min(temp_free, db_free - write_bytes), 0)
+    max_temp = min(parse_bytes(MAX_TEMP_DIR_SIZE), temp_free) if MAX_TEMP_DIR_SIZE else temp_free
+
+    problems = []
+    if write_bytes > db_free:
+        problems.append(f"needs ~{fmt_bytes(write_bytes)} under {write_path}, {fmt_bytes(db_free)} free after reserve")
+    fits = [(name, work) for name, work in candidates if work <= memory_limit + max_temp]
+    if not fits:
+        problems.append(
+            "no strategy fits in memory + temp ("
+            + ", ".join(f"{name} ~{fmt_bytes(work)}" for name, work in candidates)
+            + f" > {fmt_bytes(memory_limit)} + {fmt_bytes(max_temp)})"
+        )
+    strategy, work = (fits or candidates[-1:])[0]
+
+    p = {
+        "step": step, "strategy": strategy, "memory_limit": memory_limit, "threads": threads,
+        "temp_dir": temp_dir, "max_temp": max_temp, "work_bytes": work,
+        "spill_bytes": max(work - memory_limit, 0), "write_bytes": write_bytes,
+    }
+    summary = (
+        f"Plan for {step}: strategy={strategy}, memory_limit={fmt_bytes(memory_limit)}, threads={threads}, "
+        f"temp={temp_dir} (max {fmt_bytes(max_temp)}, expected spill ~{fmt_bytes(p['spill_bytes'])}), "
+        f"writes ~{fmt_bytes(write_bytes)}; RAM available {fmt_bytes(ram)}, free disk {fmt_bytes(db_free)}"
+    )
+    print(summary)
+    logger.info(summary)
+    if problems:
+        msg = f"Preflight for {step}: " + "; ".join(problems)
+        if not PLANNER_FORCE:
+            logger.error(msg)
+            raise RuntimeError(msg + " (PLANNER_FORCE=1 to run anyway)")
+        print(f"WARNING: {msg}")
+        logger.warning(msg)
+    return p
+
+def apply(con: duckdb.DuckDBPyConnection, p: dict) -> None:
+    # threads and memory_limit are database-wide: they apply to every cursor of con
+    if DUCKDB_TEMP_DIR:
+        os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+    con.execute(f"SET threads={p['threads']};")
+    con.execute(f"SET memory_limit='{p['memory_limit']}B';")
+    con.execute(f"SET temp_directory='{p['temp_dir']}';")
+    con.execute(f"SET max_temp_directory_size='{p['max_temp']}B';")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# DuckDB JSON query profiles for analysis.py (ANALYSIS_PROFILE=1).
+#
+# enable_profiling and profiling_output are per-connection settings (each cursor has its
+# own), so run_query switches them on around one query at a time; DuckDB writes the plan with
+# per-operator timings and cardinalities plus the query-level metrics to
+# PROFILE_DIR/<label>.json once the query finishes. summarize() reduces a profile to what
+# the end-of-run table reports:
+#   latency, cpu      wall and CPU seconds of the whole query
+#   rows scanned      rows read by the scans (cumulative_rows_scanned)
+#   peak memory       peak buffer-manager memory (system_peak_buffer_memory)
+#   spilled           peak size of the temp directory (system_peak_temp_dir_size); non-zero
+#                     means the query spilled to temp_directory
+#   operators         per-operator name, timing and output rows, slowest first
+# The system_* metrics are database-wide, so with ANALYSIS_PARALLEL > 1 a query's peak memory
+# and spill include whatever ran next to it; run with ANALYSIS_PARALLEL=1 to attribute them.
+
+import json
+import os
+import re
+
+import duckdb
+
+import planner
+
+def profile_path(profile_dir: str, label: str) -> str:
+    """PROFILE_DIR/<label>.json, the label reduced to characters safe in a file name."""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", label).strip("._") or "query"
+    return os.path.join(profile_dir, f"{name}.json")
+
+def enable(con: duckdb.DuckDBPyConnection, path: str) -> None:
+    escaped = path.replace("'", "''")
+    con.execute("SET enable_profiling='json';")
+    con.execute(f"SET profiling_output='{escaped}';")
+
+def disable(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("RESET profiling_output;")
+    con.execute("RESET enable_profiling;")
+
+def _operators(node: dict):
+    for child in node.get("children", []):
+        if "operator_name" in child:
+            yield child
+        yield from _operators(child)
+
+def summarize(label: str, path: str) -> dict:
+    with open(path) as f:
+        root = json.load(f)
+    operators = sorted(
+        (
+            {"name": op["operator_name"].strip(), "seconds": op.get("operator_timing", 0.0),
+             "rows": op.get("operator_cardinality", 0)}
+            for op in _operators(root)
+        ),
+        key=lambda op: op["seconds"], reverse=True,
+    )
+    return {
+        "label": label,
+        "path": path,
+        "latency": root.get("latency", 0.0),
+        "cpu": root.get("cpu_time", 0.0),
+        "rows_scanned": root.get("cumulative_rows_scanned", 0),
+        "peak_memory": root.get("system_peak_buffer_memory", 0),
+        "spilled": root.get("system_peak_temp_dir_size", 0),
+        "operators": operators,
+    }
+
+def report(profiles: list, temp_dir: str, top_operators: int = 3) -> list:
+    """Summary table lines, slowest query first, with each query's slowest operators."""
+    total = sum(p["latency"] for p in profiles) or 1.0
+    lines = [
+        f"{'query':50}{'latency':>9}{'share':>7}{'cpu':>8}{'rows scanned':>15}{'peak mem':>11}{'spilled':>11}"
+    ]
+    for p in sorted(profiles, key=lambda p: p["latency"], reverse=True):
+        lines.append(
+            f"{p['label'][:49]:50}{p['latency']:>8.2f}s{p['latency'] / total:>7.0%}{p['cpu']:>7.2f}s"
+            f"{p['rows_scanned']:>15,}{planner.fmt_bytes(p['peak_memory']):>11}{planner.fmt_bytes(p['spilled']):>11}"
+        )
+        for op in p["operators"][:top_operators]:
+            lines.append(f"    {op['name'][:42]:42}{op['seconds']:>8.3f}s  rows={op['rows']:,}")
+    spills = [p["label"] for p in profiles if p["spilled"]]
+    lines.append(
+        f"Spilled to {temp_dir}: " + (", ".join(spills) if spills else "none")
+    )
+    return lines
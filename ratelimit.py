@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# Adaptive request pacing and retries for the remote TLC fetches (load.py, tlc_cache.py).
+#
+# AdaptiveLimiter is a token bucket whose refill rate follows AIMD: every successful
+# request adds `increase` req/s (up to max_rps), every throttle/5xx/timeout halves it (down
+# to min_rps) and, with a Retry-After, holds all requests until then. with_retries() runs
+# one unit of work (a month) through the limiter with bounded, fully jittered exponential
+# backoff, retrying only failures that are worth retrying.
+
+import logging
+import random
+import socket
+import threading
+import time
+import urllib.error
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+class AdaptiveLimiter:
+    """Thread-safe AIMD token bucket; acquire() blocks until a request may start."""
+
+    def __init__(
+        self,
+        rate: float,
+        min_rps: float,
+        max_rps: float,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        burst: float = 1.0
+    ):
+        self.min_rps, self.max_rps = min_rps, max_rps
+        self.increase, self.decrease, self.burst = increase, decrease, burst
+        self.rate = min(max(rate, min_rps), max_rps)
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._hold_until = 0.0
+        self._lock = threading.Lock()
+        self._started = None
+        self.requests = 0
+        self.throttles = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._hold_until - now
+                if wait <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    if self._started is None:
+                        self._started = now
+                    return
+                if wait <= 0:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rps, self.rate + self.increase)
+
+    def throttled(self, retry_after: float = None) -> None:
+        with self._lock:
+            self.throttles += 1
+            self.rate = max(self.min_rps, self.rate * self.decrease)
+            if retry_after:
+                self._hold_until = max(self._hold_until, time.monotonic() + retry_after)
+            # Spend the bucket so the next request waits a full interval at the new rate
+            self._tokens = min(self._tokens, 0.0)
+        logger.info(f"Backing off: rate now {self.rate:.2f} req/s" + (f", holding {retry_after:.0f}s" if retry_after else ""))
+
+    def effective_rps(self) -> float:
+        if self._started is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return self.requests / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests, effective {self.effective_rps():.2f} req/s, "
+            f"current rate {self.rate:.2f} req/s, {self.throttles} backoffs"
+        )
+
+def _retry_after(e: Exception):
+    headers = getattr(e, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None   # HTTP-date form: fall back to the jittered backoff
+
+def is_transient(e: Exception) -> bool:
+    """429/5xx, timeouts, dropped connections and truncated downloads; not 404s or bad data."""
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in RETRY_STATUSES
+    if isinstance(e, (urllib.error.URLError, socket.timeout, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(e, duckdb.HTTPException):
+        return getattr(e, "status_code", None) in RETRY_STATUSES
+    if isinstance(e, duckdb.IOException):
+        msg = str(e).lower()
+        return any(s in msg for s in ("could not connect", "timed out", "timeout", "connection"))
+    return isinstance(e, OSError) and str(e).startswith("Truncated download")
+
+def with_retries(fn, limiter: AdaptiveLimiter, label: str, attempts: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+    """
+    fn() with up to `attempts` tries. fn makes its own limiter.acquire() calls (one per remote
+    request); every transient failure slows the limiter down, the last one included, and is
+    followed by a full-jitter backoff before the next try; anything else is raised at once (and
+    counts as an answered request).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_transient(e):
+                # A definite answer (404, bad file) means the server is not pushing back
+                limiter.success()
+                raise
+            # Every transient failure slows the limiter, the last one too: the next month's
+            # requests should not go out at the rate the server just refused
+            retry_after = _retry_after(e)
+            limiter.throttled(retry_after)
+            if attempt == attempts:
+                raise
+            delay = retry_after or random.uniform(0, min(backoff_max, backoff_base * 2 ** (attempt - 1)))
+            logger.warning(f"RETRY {label} ({attempt}/{attempts - 1}) in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            continue
+        limiter.success()
+        return result
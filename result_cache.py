@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# On-disk cache of analysis.py query results.
+#
+# Each result is an Arrow IPC file CACHE_DIR/objects/<key>.arrow, where key is the sha256 of
+# (normalized SQL, parameters, data fingerprint); index.json maps keys to their label, size,
+# fingerprint and last use, and the least recently used entries are evicted once the cache
+# exceeds max_bytes (0 = unlimited). Entries recorded under another fingerprint are dropped
+# when the cache is opened, so reloading, recleaning or rebuilding anything upstream
+# invalidates every result computed from the old data.
+#
+# Files made from the results (the plot) can be recorded too; they count as current while the
+# fingerprint and the file itself are unchanged, so an unchanged rerun need not redraw them.
+#
+# The fingerprint only reads catalog metadata and the small bookkeeping tables, never the
+# trips, so computing it costs milliseconds. Logging goes to analysis.log.
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import duckdb
+import pyarrow as pa
+import pyarrow.ipc
+
+from common import LOAD_MANIFEST
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Small tables whose full content feeds the fingerprint: which source months are loaded,
+# per-month row counts and content hashes of the clean tables, and the emissions factors
+UPSTREAM_TABLES = (LOAD_MANIFEST, "clean_watermark", "vehicle_emissions")
+
+# dbt SQL that turns the clean tables into the marts analysis.py reads
+DBT_SQL_GLOBS = ("dbt/models/**/*.sql", "dbt/macros/**/*.sql")
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace-insensitive form of a query, so re-indenting it keeps its cache entries."""
+    return " ".join(sql.split()).rstrip(";").strip()
+
+def data_fingerprint(con: duckdb.DuckDBPyConnection) -> str:
+    """
+    sha256 over the bookkeeping tables' contents, the definition and row-count estimate of
+    every table and view, the size/mtime of the Parquet files views read (lake mode) and the
+    dbt model SQL.
+    """
+    h = hashlib.sha256()
+    existing = {name for (name,) in con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE database_name = current_database()"
+    ).fetchall()}
+    for tbl in UPSTREAM_TABLES:
+        if tbl in existing:
+            n, digest = con.execute(f"SELECT COUNT(*), COALESCE(bit_xor(hash(t)), 0) FROM {tbl} t").fetchone()
+            h.update(f"{tbl}:{n}:{digest}\n".encode())
+
+    # Catalog only (no scans); dbt rebuilds and lake re-points show up as new definitions
+    for row in con.execute("""
+        SELECT schema_name, table_name, sql, estimated_size FROM duckdb_tables()
+        WHERE database_name = current_database() AND NOT internal
+        ORDER BY 1, 2
+    """).fetchall():
+        h.update(f"table:{row}\n".encode())
+    views = con.execute("""
+        SELECT schema_name, view_name, sql FROM duckdb_views()
+        WHERE database_name = current_database() AND NOT internal
+        ORDER BY 1, 2
+    """).fetchall()
+    for row in views:
+        h.update(f"view:{row}\n".encode())
+
+    # Files behind read_parquet() views: a rewritten month has a new size/mtime
+    patterns = sorted({p for _, _, sql in views for p in re.findall(r"'([^']+\.parquet)'", sql or "")})
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            st = os.stat(path)
+            h.update(f"file:{path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+
+    for pattern in DBT_SQL_GLOBS:
+        for path in sorted(glob.glob(os.path.join(REPO_DIR, pattern), recursive=True)):
+            with open(path, "rb") as f:
+                h.update(f"dbt:{os.path.relpath(path, REPO_DIR)}:".encode() + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    Thread-safe key -> Arrow table store for one data fingerprint, with LRU eviction once the
+    cache exceeds max_bytes (0 = unlimited). Counts hits and misses for the run summary.
+    """
+
+    def __init__(self, cache_dir: str, fingerprint: str, max_bytes: int = 0):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.artifacts_path = os.path.join(cache_dir, "artifacts.json")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._index = self._read_index()
+        self._invalidate()
+
+    # Index helpers (callers hold self._lock when mutating)
+
+    def _read_index(self) -> dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _write_index(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.index_path)
+
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "objects", f"{key}.arrow")
+
+    def _drop(self, key: str) -> int:
+        entry = self._index.pop(key)
+        path = self._object_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        return entry["size"]
+
+    def _invalidate(self) -> None:
+        with self._lock:
+            stale = [k for k, e in self._index.items() if e["fingerprint"] != self.fingerprint]
+            freed = sum(self._drop(k) for k in stale)
+            if stale:
+                self._write_index()
+                logger.info(f"Result cache: data changed, dropped {len(stale)} entries ({freed:,} bytes)")
+
+    def _evict(self, keep_key: str) -> None:
+        if not self.max_bytes:
+            return
+        total = sum(e["size"] for e in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep_key:
+                continue
+            total -= self._drop(key)
+            logger.info(f"Result cache evicted {entry['label']} ({entry['size']:,} bytes)")
+
+    # Public entry points
+
+    def key(self, sql: str, params=None) -> str:
+        payload = json.dumps([normalize_sql(sql), list(params or []), self.fingerprint], default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        """The cached table for key, or None."""
+        with self._lock:
+            entry = self._index.get(key)
+            path = self._object_path(key)
+            if entry is None or not os.path.exists(path):
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self._write_index()
+            self.hits += 1
+        return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+    def put(self, key: str, label: str, tbl: pa.Table) -> None:
+        path = self._object_path(key)
+        tmp = f"{path}.{threading.get_ident()}.part"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, tbl.schema) as writer:
+            writer.write_table(tbl)
+        os.replace(tmp, path)
+        with self._lock:
+            self._index[key] = {
+                "label": label, "size": os.path.getsize(path), "fingerprint": self.fingerprint,
+                "created": time.time(), "last_used": time.time(),
+            }
+            self._evict(keep_key=key)
+            self._write_index()
+
+    def _artifacts(self) -> dict:
+        if not os.path.exists(self.artifacts_path):
+            return {}
+        with open(self.artifacts_path) as f:
+            return json.load(f)
+
+    def artifact_current(self, path: str) -> bool:
+        """True when path was written from this fingerprint's results and not touched since."""
+        entry = self._artifacts().get(os.path.abspath(path))
+        return (
+            entry is not None and os.path.exists(path)
+            and entry["fingerprint"] == self.fingerprint and entry["mtime_ns"] == os.stat(path).st_mtime_ns
+        )
+
+    def record_artifact(self, path: str) -> None:
+        with self._lock:
+            artifacts = self._artifacts()
+            artifacts[os.path.abspath(path)] = {"fingerprint": self.fingerprint, "mtime_ns": os.stat(path).st_mtime_ns}
+            tmp = self.artifacts_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(artifacts, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.artifacts_path)
+
+    def summary(self) -> str:
+        size = sum(e["size"] for e in self._index.values())
+        return f"{self.hits} hits, {self.misses} misses; {len(self._index)} entries, {size:,} bytes in {self.cache_dir}"
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Persistent registry of TLC file schemas, stored next to the data in the DuckDB file.
+#
+# schema_registry maps (file name, source fingerprint) -> taxi type, schema hash and the
+# month it was seen in; schema_epochs keeps one row per distinct (taxi type, schema) with
+# its columns. A month whose file is already registered gets its columns from here and
+# skips the DESCRIBE footer round trip; load.py builds the projection (cast list) from them
+# on every run, so a change to COMMON_KEEP_COLS or the type map applies at once.
+
+import hashlib
+import logging
+
+import duckdb
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TABLE = "schema_registry"
+EPOCHS_TABLE   = "schema_epochs"
+
+def ensure_registry(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {EPOCHS_TABLE} (
+            taxi_type   VARCHAR,
+            schema_hash VARCHAR,
+            columns     VARCHAR[],   -- "name TYPE" as reported by DESCRIBE, in file order
+            PRIMARY KEY (taxi_type, schema_hash)
+        );
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+            file_name          VARCHAR,
+            source_fingerprint VARCHAR,
+            taxi_type          VARCHAR,
+            month              DATE,
+            schema_hash        VARCHAR,
+            registered_at      TIMESTAMP,
+            PRIMARY KEY (file_name, source_fingerprint)
+        );
+    """)
+
+def describe_columns(con: duckdb.DuckDBPyConnection, src: str):
+    """[(column name, type)] of a Parquet file, read from its footer."""
+    return [(row[0], row[1]) for row in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{src}')").fetchall()]
+
+def schema_hash(columns) -> str:
+    # Order-insensitive: the projection selects by name
+    canon = "\n".join(sorted(f"{name} {ctype}" for name, ctype in columns))
+    return hashlib.sha1(canon.encode()).hexdigest()[:16]
+
+def known_columns(con: duckdb.DuckDBPyConnection, taxi_type: str) -> dict:
+    """(file name, fingerprint) -> column names for every registered file of this taxi type."""
+    rows = con.execute(f"""
+        SELECT r.file_name, r.source_fingerprint, e.columns
+        FROM {REGISTRY_TABLE} r
+        JOIN {EPOCHS_TABLE} e USING (taxi_type, schema_hash)
+        WHERE r.taxi_type = ?
+    """, [taxi_type]).fetchall()
+    return {(f, fp): [c.split(" ", 1)[0] for c in cols] for f, fp, cols in rows}
+
+def register(
+    con: duckdb.DuckDBPyConnection,
+    taxi_type: str,
+    file_name: str,
+    fingerprint: str,
+    month: str,
+    columns
+) -> str:
+    h = schema_hash(columns)
+    con.execute(f"""
+        INSERT INTO {EPOCHS_TABLE} (taxi_type, schema_hash, columns) VALUES (?, ?, ?)
+        ON CONFLICT (taxi_type, schema_hash) DO NOTHING;
+    """, [taxi_type, h, [f"{n} {t}" for n, t in columns]])
+    con.execute(f"""
+        INSERT OR REPLACE INTO {REGISTRY_TABLE} (file_name, source_fingerprint, taxi_type, month, schema_hash, registered_at)
+        VALUES (?, ?, ?, DATE '{month}', ?, now());
+    """, [file_name, fingerprint, taxi_type, h])
+    logger.info(f"Registered schema {h} for {file_name}")
+    return h
+
+def epoch_report(con: duckdb.DuckDBPyConnection, taxi_type: str):
+    """
+    One line per distinct schema of this taxi type, in order of first appearance,
+    with the columns added/removed relative to the previous epoch
+    (e.g. when congestion_surcharge or airport_fee first appear).
+    """
+    rows = con.execute(f"""
+        SELECT e.schema_hash, e.columns, MIN(r.month) AS first_month, MAX(r.month) AS last_month,
+               COUNT(DISTINCT r.month) AS n_months
+        FROM {EPOCHS_TABLE} e
+        JOIN {REGISTRY_TABLE} r USING (taxi_type, schema_hash)
+        WHERE e.taxi_type = ?
+        GROUP BY ALL
+        ORDER BY first_month
+    """, [taxi_type]).fetchall()
+
+    lines = []
+    prev = None
+    for i, (h, columns, first, last, n) in enumerate(rows, start=1):
+        cols = dict(c.split(" ", 1) for c in columns)
+        if prev is None:
+            change = f"{len(cols)} columns"
+        else:
+            added   = [f"+{c}" for c in cols if c not in prev]
+            removed = [f"-{c}" for c in prev if c not in cols]
+            retyped = [f"~{c} {prev[c]}->{cols[c]}" for c in cols if c in prev and prev[c] != cols[c]]
+            change = " ".join(added + removed + retyped) or "same columns"
+        lines.append(f"epoch {i} [{h}] {first:%Y-%m}..{last:%Y-%m} ({n} month{'s' if n != 1 else ''}): {change}")
+        prev = cols
+    return lines
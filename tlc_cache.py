@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+# Local content-addressed cache for the TLC monthly Parquet files.
+#
+# Files are downloaded once into CACHE_DIR/objects/<sha256[:2]>/<sha256>.parquet and
+# index.json maps each file name (e.g. yellow_tripdata_2019-07.parquet, unique per month)
+# to its object (source URL, size, ETag, checksum, last use), so a mirror or offline run
+# finds the same entries. Logging goes to whichever stage imports this module (load.log).
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 8 * 1024 * 1024
+HTTP_TIMEOUT = 60
+
+def _is_remote(url: str) -> bool:
+    return url.startswith(("http://", "https://"))
+
+def head(url: str):
+    """HEAD request returning (size or None, ETag or None, Last-Modified or None)."""
+    req = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+        size = resp.headers.get("Content-Length")
+        return (int(size) if size else None), resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+def _fingerprint(size, etag, last_modified) -> str:
+    if etag:
+        return f"etag={etag};size={size}"
+    return f"last_modified={last_modified};size={size}"
+
+def source_identity(url: str, cache=None):
+    """
+    (fingerprint, HEAD result) for the file behind url. The fingerprint is a cheap identity
+    used to tell whether a month changed: ETag/size (or Last-Modified) from a HEAD for
+    remote files, size/mtime for local ones. In offline mode the fingerprint stored with
+    the cached entry when it was last fetched or validated stands in for the HEAD, so it is
+    the same whether a month was loaded online or offline. The HEAD result (None when no request was made) is passed on to
+    ParquetCache.resolve, so a month costs one HEAD rather than two.
+    """
+    if cache is not None and cache.offline and _is_remote(url):
+        entry = cache._cached_entry(url)
+        if entry is not None:
+            # Entries written before fingerprints were stored only have the ETag
+            return entry.get("fingerprint") or f"etag={entry.get('etag')};size={entry['size']}", None
+        url = os.path.join(cache.cache_dir, cache._key(url))  # prepopulated plain file
+
+    if not _is_remote(url):
+        st = os.stat(url)
+        return f"size={st.st_size};mtime={int(st.st_mtime)}", None
+
+    info = head(url)
+    return _fingerprint(*info), info
+
+class ParquetCache:
+    """
+    File name -> local file cache, validated by size/ETag on reuse and sha256 (plus the ETag
+    when it is a plain MD5) on download. LRU eviction once the cache exceeds max_bytes
+    (0 = unlimited). In offline mode nothing is fetched: files come from the index or,
+    for a prepopulated directory, from CACHE_DIR/<file name of the URL>.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 0, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._index = self._read_index()
+
+    # Index helpers (callers hold self._lock when mutating)
+
+    def _read_index(self) -> dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _write_index(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.index_path)
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "objects", sha256[:2], f"{sha256}.parquet")
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return os.path.basename(url)
+
+    def _touch(self, url: str, fingerprint: str = None) -> str:
+        with self._lock:
+            entry = self._index[self._key(url)]
+            entry["last_used"] = time.time()
+            if fingerprint:
+                entry["fingerprint"] = fingerprint
+            self._write_index()
+            return self._object_path(entry["sha256"])
+
+    def _cached_entry(self, url: str):
+        entry = self._index.get(self._key(url))
+        if entry is None:
+            return None
+        path = self._object_path(entry["sha256"])
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            logger.warning(f"Cache entry for {url} is missing or truncated; dropping it")
+            with self._lock:
+                self._index.pop(self._key(url), None)
+                self._write_index()
+            return None
+        return entry
+
+    # Remote helpers
+
+    def _download(self, url: str) -> dict:
+        tmp = os.path.join(self.cache_dir, f".download-{threading.get_ident()}.part")
+        sha, md5, size = hashlib.sha256(), hashlib.md5(), 0
+        try:
+            with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as resp, open(tmp, "wb") as out:
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+                expected = resp.headers.get("Content-Length")
+                while True:
+                    chunk = resp.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    sha.update(chunk); md5.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        # Validate before the file is published under its content address
+        plain_etag = (etag or "").strip('"')
+        if expected is not None and int(expected) != size:
+            os.remove(tmp)
+            raise IOError(f"Truncated download of {url}: {size} of {expected} bytes")
+        if len(plain_etag) == 32 and "-" not in plain_etag and plain_etag != md5.hexdigest():
+            os.remove(tmp)
+            raise IOError(f"Checksum mismatch for {url}: ETag {plain_etag} != md5 {md5.hexdigest()}")
+
+        digest = sha.hexdigest()
+        path = self._object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+        return {"url": url, "sha256": digest, "size": size, "etag": etag,
+                "fingerprint": _fingerprint(size, etag, last_modified),
+                "fetched_at": time.time(), "last_used": time.time()}
+
+    def _evict(self, keep_key: str) -> None:
+        if not self.max_bytes:
+            return
+        with self._lock:
+            live = {e["sha256"]: e["size"] for e in self._index.values()}
+            total = sum(live.values())
+            for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                if key == keep_key:
+                    continue
+                del self._index[key]
+                if all(e["sha256"] != entry["sha256"] for e in self._index.values()):
+                    path = self._object_path(entry["sha256"])
+                    if os.path.exists(path):
+                        os.remove(path)
+                    total -= entry["size"]
+                logger.info(f"Cache evicted {key} ({entry['size']:,} bytes)")
+            self._write_index()
+
+    # Public entry point
+
+    def resolve(self, url: str, head_info=None) -> str:
+        """
+        Return a local path holding the file at url, fetching it if needed. head_info is
+        a HEAD result the caller already has (see source_identity); without it a cached
+        copy is validated with a HEAD of its own.
+        """
+        if not _is_remote(url):
+            return url
+
+        entry = self._cached_entry(url)
+
+        if self.offline:
+            if entry is not None:
+                return self._touch(url)
+            local = os.path.join(self.cache_dir, self._key(url))
+            if os.path.exists(local):
+                return local
+            raise FileNotFoundError(f"Offline mode: {url} is not in the cache at {self.cache_dir}")
+
+        if entry is not None:
+            try:
+                head_info = head_info or head(url)
+            except (urllib.error.URLError, OSError) as e:
+                logger.warning(f"HEAD {url} failed ({e}); using cached copy")
+                return self._touch(url)
+            size, etag, _ = head_info
+            if (size is None or size == entry["size"]) and (etag is None or etag == entry.get("etag")):
+                logger.info(f"Cache hit: {url}")
+                return self._touch(url, _fingerprint(*head_info))
+            logger.info(f"Cache stale (size/ETag changed): {url}")
+
+        logger.info(f"Cache miss, downloading: {url}")
+        new_entry = self._download(url)
+        if head_info is not None:
+            new_entry["fingerprint"] = _fingerprint(*head_info)  # the one recorded in load_manifest
+        with self._lock:
+            self._index[self._key(url)] = new_entry
+            self._write_index()
+        self._evict(keep_key=self._key(url))
+        return self._object_path(new_entry["sha256"])